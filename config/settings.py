@@ -100,6 +100,28 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHE_LOCATION = getenv("CACHE_LOCATION")
+
+if CACHE_LOCATION:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_LOCATION,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+ROLES_CACHE_TIMEOUT = 60 * 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -140,6 +162,16 @@ STATICFILES_DIRS = [BASE_DIR / "static/"]
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    "blobs": {"BACKEND": "src.storage.ContentAddressedStorage"},
+}
+
+IMAGE_DERIVATIVE_WIDTHS = [64, 160, 320, 640]
+IMAGE_DERIVATIVE_FORMATS = ["webp", "jpeg"]
+IMAGE_DERIVATIVE_QUALITY = 80
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -149,16 +181,49 @@ AUTH_USER_MODEL = "users.User"
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication'],
+        'users.authentication.StatelessJWTAuthentication'],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated']
 }
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=180),
-    'REFRESH_TOKEN_LIFETIME': timedelta(days=1)}
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    'TOKEN_OBTAIN_SERIALIZER': 'users.serializers.MyTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'users.serializers.MyTokenRefreshSerializer'}
 
 STRIPE_API_KEY = getenv("STRIPE_API_KEY")
+STRIPE_WEBHOOK_SECRET = getenv("STRIPE_WEBHOOK_SECRET")
+STRIPE_PRICE_CACHE_TIMEOUT = 24 * 60 * 60
+STRIPE_TIMEOUT = 10
+STRIPE_CONNECT_TIMEOUT = 3
+STRIPE_MAX_RETRIES = 2
+STRIPE_RETRY_BACKOFF = 0.5
+STRIPE_POOL_SIZE = 10
+STRIPE_BREAKER_THRESHOLD = 5
+STRIPE_BREAKER_RESET_TIMEOUT = 30
+STRIPE_EVENTS_PROCESS_DELAY = 2
+STRIPE_EVENTS_BATCH_SIZE = 500
+PAYMENT_STATUS_MAX_WAIT = 3
+PAYMENT_STATUS_POLL_INTERVAL = 1
+PAYMENT_RECONCILE_BATCH_SIZE = 100
+PAYMENT_RECONCILE_CONCURRENCY = 8
+PAYMENT_RECONCILE_DAYS = 2
+PAYMENT_EXPORT_CHUNK_SIZE = 2000
+
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+IDEMPOTENCY_LOCK_TIMEOUT = 30
+IDEMPOTENCY_WAIT = 5
+IDEMPOTENCY_POLL_INTERVAL = 0.1
+
+COURSE_LESSONS_LIMIT = 20
+LESSON_BULK_MAX_SIZE = 500
+LESSON_BULK_BATCH_SIZE = 100
+USER_PAYMENTS_LIMIT = 10
+SEARCH_RESULTS_LIMIT = 20
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MIN_LENGTH = 3
+AUTOCOMPLETE_CACHE_TIMEOUT = 60
 
 SWAGGER_SETTINGS = {
     'SECURITY_DEFINITIONS': {
@@ -180,13 +245,27 @@ EMAIL_HOST_PASSWORD = getenv("EMAIL_HOST_PASSWORD")
 SERVER_EMAIL = EMAIL_HOST_USER
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+COURSE_UPDATE_MAIL_CHUNK_SIZE = 100
+COURSE_UPDATE_NOTIFICATION_WINDOW = 15 * 60
+
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_BROKER_URL = getenv("CELERY_BROKER_URL")
 CELERY_RESULT_BACKEND = getenv("CELERY_RESULT_BACKEND")
 CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
 
 
+INACTIVE_USER_DAYS = 30
+BLOCK_INACTIVE_USERS_CHUNK_SIZE = 1000
+
+LAST_LOGIN_FLUSH_BATCH_SIZE = 1000
+
 CELERY_BEAT_SCHEDULE = {
     'block_inactive_users': {
         'task': 'users.tasks.block_inactive_users',
-        'schedule': timedelta(days=1)}}
+        'schedule': timedelta(days=1)},
+    'flush_last_login_buffer': {
+        'task': 'users.tasks.flush_last_login_buffer',
+        'schedule': timedelta(minutes=1)},
+    'reconcile_payment_statuses': {
+        'task': 'users.tasks.reconcile_payment_statuses',
+        'schedule': timedelta(minutes=1)}}
@@ -1,7 +1,7 @@
 
 from django.contrib import admin
 
-from .models import Course, Lesson, Payment
+from .models import Course, Lesson, MediaBlob, Payment, StripeEvent, StripePrice
 
 
 # Register your models here.
@@ -27,3 +27,27 @@ class PaymentAdmin(admin.ModelAdmin):
     Класс для отображения модели Payment в интерфейсе админки
     """
     list_display = ("id", "payment_date")
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    """
+    Класс для отображения модели StripeEvent в интерфейсе админки
+    """
+    list_display = ("id", "event_id", "type", "received_at", "processed_at")
+
+
+@admin.register(StripePrice)
+class StripePriceAdmin(admin.ModelAdmin):
+    """
+    Класс для отображения модели StripePrice в интерфейсе админки
+    """
+    list_display = ("id", "course", "lesson", "amount", "currency", "price_id")
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    """
+    Класс для отображения модели MediaBlob в интерфейсе админки
+    """
+    list_display = ("id", "name", "references", "created_at")
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mypedia", "0010_course_updated_at_lesson_updated_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StripeEvent",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("event_id", models.CharField(max_length=255, unique=True, verbose_name="ID события")),
+                ("type", models.CharField(max_length=100, verbose_name="Тип события")),
+                ("payload", models.JSONField(verbose_name="Данные события")),
+                ("received_at", models.DateTimeField(auto_now_add=True, verbose_name="Дата получения")),
+                ("processed_at", models.DateTimeField(blank=True, null=True, verbose_name="Дата обработки")),
+            ],
+            options={
+                "verbose_name": "Событие stripe",
+                "verbose_name_plural": "События stripe",
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("processed_at__isnull", True)),
+                        fields=["id"],
+                        name="mypedia_stripe_event_pending",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mypedia", "0011_stripeevent"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StripePrice",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("amount", models.PositiveIntegerField(verbose_name="Сумма оплаты")),
+                ("currency", models.CharField(max_length=3, verbose_name="Валюта")),
+                ("product_id", models.CharField(max_length=255, verbose_name="ID продукта")),
+                ("price_id", models.CharField(max_length=255, verbose_name="ID цены")),
+                (
+                    "course",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stripe_prices",
+                        to="mypedia.course",
+                        verbose_name="Курс",
+                    ),
+                ),
+                (
+                    "lesson",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stripe_prices",
+                        to="mypedia.lesson",
+                        verbose_name="Урок",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Цена stripe",
+                "verbose_name_plural": "Цены stripe",
+                "constraints": [
+                    models.UniqueConstraint(
+                        condition=models.Q(("course__isnull", False)),
+                        fields=("course", "amount", "currency"),
+                        name="mypedia_stripe_price_course_unique",
+                    ),
+                    models.UniqueConstraint(
+                        condition=models.Q(("lesson__isnull", False)),
+                        fields=("lesson", "amount", "currency"),
+                        name="mypedia_stripe_price_lesson_unique",
+                    ),
+                ],
+            },
+        ),
+    ]
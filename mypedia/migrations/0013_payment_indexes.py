@@ -0,0 +1,43 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("mypedia", "0012_stripeprice"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="payment",
+            index=models.Index(fields=["owner", "id"], name="mypedia_payment_owner_id_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="payment",
+            index=models.Index(fields=["owner", "payment_date"], name="mypedia_payment_owner_date_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="payment",
+            index=models.Index(fields=["status", "id"], name="mypedia_payment_status_id_idx"),
+        ),
+        migrations.AlterField(
+            model_name="payment",
+            name="owner",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="payments",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Пользователь",
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+def deduplicate_subscriptions(apps, schema_editor):
+    """
+    Удаление повторных подписок пользователя на курс: остается активная подписка, а среди равных - последняя
+    """
+    Subscription = apps.get_model("mypedia", "Subscription")
+    duplicates = Subscription.objects.values("owner", "course").annotate(total=Count("id")).filter(total__gt=1)
+    for pair in duplicates.iterator():
+        ids = list(Subscription.objects.filter(owner=pair["owner"], course=pair["course"])
+                   .order_by("-is_active", "-id").values_list("id", flat=True))
+        Subscription.objects.filter(id__in=ids[1:]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mypedia", "0013_payment_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_subscriptions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mypedia", "0014_deduplicate_subscriptions"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="subscription",
+            index=models.Index(
+                condition=models.Q(("is_active", True)), fields=["course"], name="mypedia_subscription_act_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="subscription",
+            constraint=models.UniqueConstraint(
+                fields=("owner", "course"), name="mypedia_subscription_owner_course_unique"
+            ),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:15
+
+from django.db import migrations, models
+
+import src.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mypedia", "0017_course_lesson_name_trgm"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MediaBlob",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("name", models.CharField(max_length=255, unique=True, verbose_name="Путь файла")),
+                ("references", models.PositiveIntegerField(default=0, verbose_name="Количество ссылок")),
+                ("created_at", models.DateTimeField(auto_now_add=True, verbose_name="Дата загрузки")),
+            ],
+            options={
+                "verbose_name": "Файл",
+                "verbose_name_plural": "Файлы",
+            },
+        ),
+        migrations.AlterField(
+            model_name="course",
+            name="preview",
+            field=models.ImageField(
+                blank=True, null=True, storage=src.storage.get_blob_storage, upload_to="mypedia/courses/previews/"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="lesson",
+            name="preview",
+            field=models.ImageField(
+                blank=True, null=True, storage=src.storage.get_blob_storage, upload_to="mypedia/courses/previews/"
+            ),
+        ),
+    ]
@@ -0,0 +1,34 @@
+from collections import Counter
+
+from django.db import migrations
+from django.db.models import Count
+
+REFERENCES = [("mypedia", "Course", "preview"), ("mypedia", "Lesson", "preview"), ("users", "User", "avatar")]
+
+
+def count_media_references(apps, schema_editor):
+    """
+    Подсчет ссылок на уже загруженные файлы курсов, уроков и пользователей
+    """
+    MediaBlob = apps.get_model("mypedia", "MediaBlob")
+    references = Counter()
+    for app_label, model_name, field in REFERENCES:
+        files = (apps.get_model(app_label, model_name).objects.exclude(**{f"{field}__isnull": True})
+                 .exclude(**{field: ""}).values(field).annotate(total=Count("pk")))
+        for item in files.iterator():
+            references[item[field]] += item["total"]
+
+    MediaBlob.objects.bulk_create([MediaBlob(name=name, references=total) for name, total in references.items()],
+                                  batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mypedia", "0018_mediablob_blob_storage"),
+        ("users", "0006_user_avatar_blob_storage"),
+    ]
+
+    operations = [
+        migrations.RunPython(count_media_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:45
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mypedia", "0019_count_media_references"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="mediablob",
+            name="derivative_widths",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.PositiveSmallIntegerField(),
+                blank=True,
+                null=True,
+                size=None,
+                verbose_name="Ширины уменьшенных копий",
+            ),
+        ),
+    ]
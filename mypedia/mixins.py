@@ -0,0 +1,174 @@
+import json
+import time
+from hashlib import md5
+
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+
+from config import settings
+
+
+class ConditionalGetMixin:
+    """
+    Поддержка условных GET-запросов (ETag и Last-Modified) для списка и просмотра объектов:
+    версия вычисляется только по отдаваемым объектам (странице списка), если данные не изменились,
+    возвращается ответ 304 без сериализации.
+    Last-Modified используется только при просмотре объекта, если его представление
+    зависит лишь от даты изменения (retrieve_last_modified), для списков удаление объекта
+    не меняет дату последнего изменения
+    """
+    retrieve_last_modified = True
+
+    def get_version_queryset(self):
+        """
+        Набор объектов для вычисления версии, без аннотаций для сериализации
+        """
+        return self.get_queryset()
+
+    def get_version(self, objects):
+        """
+        Дата последнего изменения и признаки версии отдаваемых объектов
+        """
+        last_modified = max((obj.updated_at for obj in objects), default=None)
+        return last_modified, [(obj.pk, obj.updated_at.isoformat()) for obj in objects]
+
+    def get_conditional_response(self, request, objects, *parts, use_last_modified=False):
+        """
+        Вычисление ETag и Last-Modified, ответ 304 при совпадении с заголовками запроса
+        """
+        last_modified, version = self.get_version(objects)
+        self.last_modified = last_modified if use_last_modified else None
+        parts = [request.user.pk, request.get_full_path(), last_modified, *version, *parts]
+        self.etag = quote_etag(md5("|".join(map(str, parts)).encode(), usedforsecurity=False).hexdigest())
+
+        response = get_conditional_response(request,
+                                            etag=self.etag,
+                                            last_modified=self.last_modified and int(self.last_modified.timestamp()))
+        if response is not None:
+            return self.add_conditional_headers(response)
+
+    def add_conditional_headers(self, response):
+        """
+        Заполнение заголовков ETag и Last-Modified в ответе
+        """
+        response["ETag"] = self.etag
+        if self.last_modified:
+            response["Last-Modified"] = http_date(self.last_modified.timestamp())
+        response["Cache-Control"] = "private, no-cache"
+        patch_vary_headers(response, ["Authorization"])
+        return response
+
+    def list(self, request, *args, **kwargs):
+        """
+        Список объектов с поддержкой условного запроса: страница выбирается по ID и дате изменения,
+        версия учитывает ее объекты и ссылки пагинации, полная выборка выполняется только для ответа 200
+        """
+        queryset = self.filter_queryset(self.get_version_queryset()).only("pk", "updated_at")
+        page = self.paginate_queryset(queryset)
+        objects = list(queryset) if page is None else page
+        pagination = "" if page is None else json.dumps(self.get_paginated_response([]).data, default=str)
+
+        response = self.get_conditional_response(request, objects, pagination)
+        if response is not None:
+            return response
+
+        instances = self.get_queryset().in_bulk([obj.pk for obj in objects])
+        serializer = self.get_serializer([instances[obj.pk] for obj in objects if obj.pk in instances], many=True)
+        if page is None:
+            return self.add_conditional_headers(Response(serializer.data))
+        return self.add_conditional_headers(self.get_paginated_response(serializer.data))
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Просмотр объекта с поддержкой условного запроса: права доступа и версия проверяются
+        по объекту без аннотаций, полная выборка выполняется только для ответа 200
+        """
+        queryset = self.filter_queryset(self.get_version_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        obj = get_object_or_404(queryset, **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        self.check_object_permissions(request, obj)
+
+        response = self.get_conditional_response(request, [obj], use_last_modified=self.retrieve_last_modified)
+        if response is not None:
+            return response
+        serializer = self.get_serializer(self.get_object())
+        return self.add_conditional_headers(Response(serializer.data))
+
+
+class IdempotentCreateMixin:
+    """
+    Поддержка заголовка Idempotency-Key при создании объекта: первый ответ сохраняется в кеше
+    и возвращается на повторные запросы с тем же ключом, одновременные повторы ждут завершения первого
+    """
+    idempotency_header = "Idempotency-Key"
+
+    def get_idempotency_cache_key(self, request, key):
+        """
+        Ключ кеша ответа для пользователя, адреса и ключа идемпотентности
+        """
+        digest = md5(f"{request.user.pk}|{request.path}|{key}".encode(), usedforsecurity=False).hexdigest()
+        return f"idempotency:{digest}"
+
+    def wait_for_idempotent_response(self, cache_key, lock_key):
+        """
+        Ожидание ответа на первый запрос, пока он выполняется, но не дольше IDEMPOTENCY_WAIT
+        """
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT
+        while time.monotonic() < deadline:
+            stored = cache.get(cache_key)
+            if stored is not None or cache.get(lock_key) is None:
+                return stored
+            time.sleep(settings.IDEMPOTENCY_POLL_INTERVAL)
+        return cache.get(cache_key)
+
+    def replay_idempotent_response(self, stored, fingerprint):
+        """
+        Повтор сохраненного ответа, если тело запроса совпадает с первым запросом
+        """
+        if stored["fingerprint"] != fingerprint:
+            return Response({"detail": "Ключ идемпотентности уже использован с другими данными"},
+                            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        return Response(stored["data"], status=stored["status"], headers={"Idempotent-Replayed": "true"})
+
+    def create(self, request, *args, **kwargs):
+        """
+        Создание объекта не более одного раза для ключа идемпотентности
+        """
+        key = request.headers.get(self.idempotency_header)
+        if not key:
+            return super().create(request, *args, **kwargs)
+        if len(key) > 255:
+            raise ValidationError({self.idempotency_header: "Ключ идемпотентности длиннее 255 символов"})
+
+        cache_key = self.get_idempotency_cache_key(request, key)
+        lock_key = f"{cache_key}:lock"
+        fingerprint = md5(json.dumps(request.data, sort_keys=True, default=str).encode(),
+                          usedforsecurity=False).hexdigest()
+
+        stored = cache.get(cache_key)
+        if stored is None and cache.add(lock_key, True, timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            try:
+                stored = cache.get(cache_key)
+                if stored is None:
+                    response = super().create(request, *args, **kwargs)
+                    if response.status_code < 500:
+                        cache.set(cache_key, {"fingerprint": fingerprint, "status": response.status_code,
+                                              "data": response.data}, settings.IDEMPOTENCY_KEY_TTL)
+                    return response
+            finally:
+                cache.delete(lock_key)
+        elif stored is None:
+            stored = self.wait_for_idempotent_response(cache_key, lock_key)
+            if stored is None and cache.get(lock_key) is None:
+                # Первый запрос завершился ошибкой без сохраненного ответа
+                return self.create(request, *args, **kwargs)
+
+        if stored is None:
+            return Response({"detail": "Запрос с этим ключом идемпотентности еще выполняется"},
+                            status=status.HTTP_409_CONFLICT)
+        return self.replay_idempotent_response(stored, fingerprint)
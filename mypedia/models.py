@@ -1,17 +1,43 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
+from django.db.models.functions import Upper
+
+from src.storage import get_blob_storage
 
 PAYMENT_METHODS = [("cash", "Наличные"),
                    ("transfer_to_account", "Перевод на счет")]
 
+SEARCH_CONFIG = "russian"
+
 
 # Create your models here.
+def get_search_vector():
+    """
+    Поисковый вектор по названию (вес A) и описанию (вес B) с русской конфигурацией полнотекстового поиска
+    """
+    return (SearchVector("name", weight="A", config=SEARCH_CONFIG)
+            + SearchVector("description", weight="B", config=SEARCH_CONFIG))
+
+
+class SearchVectorDeferredManager(models.Manager):
+    """
+    Менеджер, не загружающий поисковый вектор: он нужен только для поиска на стороне БД
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().defer("search_vector")
+
+
 class Course(models.Model):
     """
     Модель курса уроков
     """
     name = models.CharField(max_length=150, verbose_name="Название")
-    preview = models.ImageField(upload_to="mypedia/courses/previews/", blank=True, null=True)
+    preview = models.ImageField(upload_to="mypedia/courses/previews/", storage=get_blob_storage,
+                                blank=True, null=True)
     description = models.TextField(verbose_name="Описание", blank=True, null=True)
     owner = models.ForeignKey(get_user_model(),
                               on_delete=models.SET_NULL,
@@ -20,10 +46,18 @@ class Course(models.Model):
                               blank=True,
                               related_name="courses")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+    search_vector = models.GeneratedField(expression=get_search_vector(),
+                                          output_field=SearchVectorField(),
+                                          db_persist=True)
+
+    objects = SearchVectorDeferredManager()
 
     class Meta:
         verbose_name = "Курс"
         verbose_name_plural = "Курсы"
+        indexes = [GinIndex(fields=["search_vector"], name="mypedia_course_search_idx"),
+                   GinIndex(OpClass(Upper("name"), name="gin_trgm_ops"),
+                            name="mypedia_course_uname_trgm_idx")]
 
     def __str__(self):
         return self.name
@@ -34,7 +68,8 @@ class Lesson(models.Model):
     Модель урока
     """
     name = models.CharField(max_length=150, verbose_name="Название")
-    preview = models.ImageField(upload_to="mypedia/courses/previews/", blank=True, null=True)
+    preview = models.ImageField(upload_to="mypedia/courses/previews/", storage=get_blob_storage,
+                                blank=True, null=True)
     description = models.TextField(verbose_name="Описание", blank=True, null=True)
     video_link = models.TextField(verbose_name="Ссылка на видео", blank=True, null=True)
     course = models.ForeignKey(Course,
@@ -50,10 +85,18 @@ class Lesson(models.Model):
                               blank=True,
                               related_name="lessons")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+    search_vector = models.GeneratedField(expression=get_search_vector(),
+                                          output_field=SearchVectorField(),
+                                          db_persist=True)
+
+    objects = SearchVectorDeferredManager()
 
     class Meta:
         verbose_name = "Урок"
         verbose_name_plural = "Уроки"
+        indexes = [GinIndex(fields=["search_vector"], name="mypedia_lesson_search_idx"),
+                   GinIndex(OpClass(Upper("name"), name="gin_trgm_ops"),
+                            name="mypedia_lesson_uname_trgm_idx")]
 
     def __str__(self):
         return self.name
@@ -72,6 +115,7 @@ class Payment(models.Model):
                               verbose_name="Пользователь",
                               null=True,
                               blank=True,
+                              db_index=False,
                               related_name="payments")
     course = models.ForeignKey(Course,
                                on_delete=models.CASCADE,
@@ -101,6 +145,10 @@ class Payment(models.Model):
     class Meta:
         verbose_name = "Платеж"
         verbose_name_plural = "Платежи"
+        # Индексы по owner заменяют индекс внешнего ключа
+        indexes = [models.Index(fields=["owner", "id"], name="mypedia_payment_owner_id_idx"),
+                   models.Index(fields=["owner", "payment_date"], name="mypedia_payment_owner_date_idx"),
+                   models.Index(fields=["status", "id"], name="mypedia_payment_status_id_idx")]
 
     def __str__(self):
         return f"Платеж №{self.pk} от {self.payment_date} - {self.amount} руб."
@@ -125,6 +173,85 @@ class Subscription(models.Model):
     class Meta:
         verbose_name = "Подписка"
         verbose_name_plural = "Подписки"
+        constraints = [models.UniqueConstraint(fields=["owner", "course"],
+                                               name="mypedia_subscription_owner_course_unique")]
+        indexes = [models.Index(fields=["course"], condition=models.Q(is_active=True),
+                                name="mypedia_subscription_act_idx")]
 
     def __str__(self):
         return f"Подписка пользователя {self.owner.name} на курс {self.course.name} от {self.created_at}"
+
+
+class StripePrice(models.Model):
+    """
+    Модель каталога продуктов и цен stripe для курсов и уроков
+    """
+    course = models.ForeignKey(Course,
+                               on_delete=models.CASCADE,
+                               verbose_name="Курс",
+                               null=True,
+                               blank=True,
+                               related_name="stripe_prices")
+    lesson = models.ForeignKey(Lesson,
+                               on_delete=models.CASCADE,
+                               verbose_name="Урок",
+                               null=True,
+                               blank=True,
+                               related_name="stripe_prices")
+    amount = models.PositiveIntegerField(verbose_name="Сумма оплаты")
+    currency = models.CharField(max_length=3, verbose_name="Валюта")
+    product_id = models.CharField(max_length=255, verbose_name="ID продукта")
+    price_id = models.CharField(max_length=255, verbose_name="ID цены")
+
+    class Meta:
+        verbose_name = "Цена stripe"
+        verbose_name_plural = "Цены stripe"
+        constraints = [
+            models.UniqueConstraint(fields=["course", "amount", "currency"],
+                                    condition=models.Q(course__isnull=False),
+                                    name="mypedia_stripe_price_course_unique"),
+            models.UniqueConstraint(fields=["lesson", "amount", "currency"],
+                                    condition=models.Q(lesson__isnull=False),
+                                    name="mypedia_stripe_price_lesson_unique"),
+        ]
+
+    def __str__(self):
+        return f"Цена {self.price_id} - {self.amount} {self.currency}"
+
+
+class StripeEvent(models.Model):
+    """
+    Модель входящих событий stripe, полученных через webhook
+    """
+    event_id = models.CharField(max_length=255, unique=True, verbose_name="ID события")
+    type = models.CharField(max_length=100, verbose_name="Тип события")
+    payload = models.JSONField(verbose_name="Данные события")
+    received_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата получения")
+    processed_at = models.DateTimeField(verbose_name="Дата обработки", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Событие stripe"
+        verbose_name_plural = "События stripe"
+        indexes = [models.Index(fields=["id"], condition=models.Q(processed_at__isnull=True),
+                                name="mypedia_stripe_event_pending")]
+
+    def __str__(self):
+        return f"Событие {self.type} {self.event_id}"
+
+
+class MediaBlob(models.Model):
+    """
+    Файл хранилища с дедупликацией и количеством ссылок на него из курсов, уроков и пользователей
+    """
+    name = models.CharField(max_length=255, unique=True, verbose_name="Путь файла")
+    references = models.PositiveIntegerField(default=0, verbose_name="Количество ссылок")
+    derivative_widths = ArrayField(models.PositiveSmallIntegerField(), null=True, blank=True,
+                                   verbose_name="Ширины уменьшенных копий")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата загрузки")
+
+    class Meta:
+        verbose_name = "Файл"
+        verbose_name_plural = "Файлы"
+
+    def __str__(self):
+        return f"{self.name} ({self.references})"
@@ -1,7 +1,69 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
-class CoursePaginator(PageNumberPagination):
+def is_cursor_mode(request):
+    """
+    Проверка, запрошен ли постраничный вывод по курсору (?pagination=cursor)
+    """
+    return request.query_params.get("pagination") == "cursor" or "cursor" in request.query_params
+
+
+class CursorPaginator(CursorPagination):
+    """
+    Пагинатор по ключу id без подсчета общего количества объектов,
+    включается параметром запроса pagination=cursor
+    """
+    ordering = "id"
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Постраничный вывод только при запросе курсорного режима
+        """
+        if not is_cursor_mode(request):
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+class PaymentHistoryPaginator(CursorPagination):
+    """
+    Пагинатор по курсору для истории платежей пользователя, начиная с последних
+    """
+    ordering = "-id"
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+
+class CursorModeMixin:
+    """
+    Переключение пагинатора в курсорный режим по параметру запроса pagination=cursor
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Выбор режима постраничного вывода
+        """
+        self.cursor_paginator = None
+        if is_cursor_mode(request):
+            self.cursor_paginator = CursorPaginator()
+            self.cursor_paginator.page_size = self.page_size
+            self.cursor_paginator.max_page_size = self.max_page_size
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        """
+        Ответ в формате выбранного режима постраничного вывода
+        """
+        if self.cursor_paginator:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class CoursePaginator(CursorModeMixin, PageNumberPagination):
     """
     Пагинатор для списка объектов Course
     """
@@ -10,7 +72,7 @@ class CoursePaginator(PageNumberPagination):
     max_page_size = 100
 
 
-class LessonPaginator(PageNumberPagination):
+class LessonPaginator(CursorModeMixin, PageNumberPagination):
     """
     Пагинатор для списка объектов Lesson
     """
@@ -1,18 +1,44 @@
 from rest_framework import serializers
+from rest_framework.reverse import reverse
+
+from config import settings
+from src.images import get_srcset
+from src.utils import get_queryset_for_owner
 
 from .models import Course, Lesson, Payment, Subscription
 from .validators import YoutubeLinkValidator
 
 
+class LessonBulkListSerializer(serializers.ListSerializer):
+    """
+    Сериализатор списка объектов модели Lesson с созданием одним запросом
+    """
+
+    def create(self, validated_data):
+        """
+        Массовое создание уроков
+        """
+        lessons = [Lesson(**attrs) for attrs in validated_data]
+        return Lesson.objects.bulk_create(lessons, batch_size=settings.LESSON_BULK_BATCH_SIZE)
+
+
 class LessonSerializer(serializers.ModelSerializer):
     """
     Сериализатор для модели Lesson
     """
+    preview_srcset = serializers.SerializerMethodField()
 
     class Meta:
         validators = [YoutubeLinkValidator(field="video_link")]
         model = Lesson
-        fields = "__all__"
+        exclude = ["search_vector"]
+        list_serializer_class = LessonBulkListSerializer
+
+    def get_preview_srcset(self, obj):
+        """
+        Ссылки на уменьшенные копии превью урока в формате srcset
+        """
+        return get_srcset(obj, "preview", self.context.get("request"))
 
 
 class SubscriptionSerializer(serializers.ModelSerializer):
@@ -25,6 +51,22 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class SubscriptionToggleSerializer(serializers.Serializer):
+    """
+    Сериализатор переключения подписки текущего пользователя на курс
+    """
+    course = serializers.PrimaryKeyRelatedField(queryset=Course.objects.all())
+    is_active = serializers.BooleanField(read_only=True)
+
+    def get_fields(self):
+        """
+        Выбор только из доступных пользователю курсов
+        """
+        fields = super().get_fields()
+        fields["course"].queryset = get_queryset_for_owner(self.context["request"].user, Course.objects.all())
+        return fields
+
+
 class CourseSerializer(serializers.ModelSerializer):
     """
     Сериализатор для модели Course
@@ -33,28 +75,45 @@ class CourseSerializer(serializers.ModelSerializer):
     lessons_count = serializers.SerializerMethodField()
     course_lessons = serializers.SerializerMethodField()
     is_subscribed = serializers.SerializerMethodField()
+    preview_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Course
-        fields = "__all__"
+        exclude = ["search_vector"]
+
+    def get_preview_srcset(self, obj):
+        """
+        Ссылки на уменьшенные копии превью курса в формате srcset
+        """
+        return get_srcset(obj, "preview", self.context.get("request"))
 
     def get_lessons_count(self, obj):
         """
         Подсчет количества уроков в курсе
         """
+        if hasattr(obj, "lessons_total"):
+            return obj.lessons_total
         return Lesson.objects.filter(course=obj).count()
 
     def get_course_lessons(self, obj):
         """
         Список уроков в курсе
         """
-        return [lesson.id for lesson in Lesson.objects.filter(course=obj)]
+        if hasattr(obj, "lesson_ids"):
+            return obj.lesson_ids
+        return list(Lesson.objects.filter(course=obj).order_by("id").values_list("id", flat=True))
 
     def get_is_subscribed(self, obj):
         """
         Проверка, подписан ли пользователь на курс
         """
-        if Subscription.objects.filter(owner=self.context["request"].user, course=obj).exists():
+        if hasattr(obj, "subscribed"):
+            is_subscribed = obj.subscribed
+        else:
+            is_subscribed = Subscription.objects.filter(owner=self.context["request"].user.pk, course=obj,
+                                                        is_active=True).exists()
+
+        if is_subscribed:
             return "Вы подписаны"
         else:
             return "Вы еще не подписаны"
@@ -65,7 +124,24 @@ class StaffCourseSerializer(CourseSerializer):
     Сериализатор для модели Course, отображающийся модератору и админу
     """
     lessons_count = serializers.SerializerMethodField()
-    course_lessons = LessonSerializer(source="lessons", many=True, read_only=True)
+    course_lessons = serializers.SerializerMethodField()
+    lessons_url = serializers.SerializerMethodField()
+
+    def get_course_lessons(self, obj):
+        """
+        Первые уроки курса, количество ограничено настройкой COURSE_LESSONS_LIMIT
+        """
+        if hasattr(obj, "preview_lessons"):
+            lessons = obj.preview_lessons
+        else:
+            lessons = obj.lessons.order_by("id")[:settings.COURSE_LESSONS_LIMIT]
+        return LessonSerializer(lessons, many=True, context=self.context).data
+
+    def get_lessons_url(self, obj):
+        """
+        Ссылка на постраничный список всех уроков курса
+        """
+        return reverse("mypedia:courses-lessons", args=[obj.pk], request=self.context.get("request"))
 
 
 class PaymentSerializer(serializers.ModelSerializer):
@@ -75,3 +151,12 @@ class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
         fields = "__all__"
+
+
+class PaymentStatusSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор статуса оплаты объекта модели Payment
+    """
+    class Meta:
+        model = Payment
+        fields = ["id", "status", "link", "session_id"]
@@ -0,0 +1,55 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from src.utils import invalidate_stripe_prices, release_media, update_media_references
+
+from .models import Course, Lesson
+from .tasks import get_file_name, schedule_image_derivatives
+
+
+@receiver(post_init, sender=Course)
+@receiver(post_init, sender=Lesson)
+def remember_name(sender, instance, **kwargs):
+    """
+    Запоминание названия и превью курса или урока
+    """
+    instance._original_name = instance.__dict__.get("name")
+    if "preview" in instance.__dict__:
+        instance._original_preview = get_file_name(instance.__dict__["preview"])
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Lesson)
+def reset_stripe_prices_on_rename(sender, instance, created, **kwargs):
+    """
+    Удаление цен stripe из каталога при переименовании курса или урока: продукт stripe содержит название
+    """
+    if not created and instance.name != instance._original_name:
+        invalidate_stripe_prices(sender._meta.model_name, instance)
+    instance._original_name = instance.name
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Lesson)
+def update_preview(sender, instance, created, **kwargs):
+    """
+    Перенос ссылки на файл и создание уменьшенных копий нового превью курса или урока
+    """
+    preview = instance.preview.name or None
+    original_preview = None if created else getattr(instance, "_original_preview", preview)
+    if preview != original_preview:
+        update_media_references(original_preview, preview)
+        if preview:
+            schedule_image_derivatives(instance, "preview")
+    instance._original_preview = preview
+
+
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Lesson)
+def release_preview(sender, instance, **kwargs):
+    """
+    Удаление ссылки на файл превью удаленного курса или урока
+    """
+    preview = get_file_name(instance.__dict__.get("preview"))
+    if preview:
+        release_media(preview)
@@ -1,21 +1,106 @@
-from celery import shared_task
-from django.core.mail import send_mail
+from celery import group, shared_task
+from django.apps import apps
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
 
 from config import settings
+from src.images import get_derivative_name, get_derivative_widths, get_image_widths, render_derivatives
 
-from .models import Course, Subscription
+from .models import Course, MediaBlob, Subscription
+
+
+def schedule_course_update_notification(pk):
+    """
+    Планирование уведомления об обновлении курса: все изменения курса в течение окна
+    COURSE_UPDATE_NOTIFICATION_WINDOW объединяются в одно отложенное уведомление
+    """
+    window = settings.COURSE_UPDATE_NOTIFICATION_WINDOW
+    if cache.add(f"mypedia:course_update:{pk}", True, timeout=window):
+        send_message_about_course_update.apply_async((pk,), countdown=window)
 
 
 @shared_task()
 def send_message_about_course_update(pk):
     """
-    Отправка подписавшимся пользователям уведомления об обновлении
+    Отправка подписавшимся пользователям уведомления об обновлении, курс мог быть удален
+    за время окна объединения изменений
     """
-    course = Course.objects.get(pk=pk)
+    course = Course.objects.filter(pk=pk).first()
+    if course is None:
+        return
     message = f"Курс {course} обновлен"
-    subscriptions = Subscription.objects.filter(course=course, is_active=True)
+    emails = Subscription.objects.filter(course=course, is_active=True).values_list("owner__email", flat=True)
+
+    chunk_size = settings.COURSE_UPDATE_MAIL_CHUNK_SIZE
+    tasks, chunk = [], []
+    for email in emails.iterator(chunk_size=chunk_size):
+        chunk.append(email)
+        if len(chunk) == chunk_size:
+            tasks.append(send_mail_chunk.s("Новые материалы", message, chunk))
+            chunk = []
+    if chunk:
+        tasks.append(send_mail_chunk.s("Новые материалы", message, chunk))
+
+    if tasks:
+        group(tasks).apply_async()
+
+
+@shared_task()
+def send_mail_chunk(subject, message, emails):
+    """
+    Отправка отдельного письма каждому получателю из пачки через одно SMTP-соединение
+    """
+    with get_connection() as connection:
+        messages = [EmailMessage(subject, message, settings.EMAIL_HOST_USER, [email], connection=connection)
+                    for email in emails]
+        return connection.send_messages(messages)
+
+
+def get_file_name(value):
+    """
+    Имя файла из значения файлового поля модели
+    """
+    return getattr(value, "name", value) or None
+
+
+def schedule_image_derivatives(instance, field_name):
+    """
+    Планирование создания уменьшенных копий загруженного изображения после сохранения объекта
+    """
+    transaction.on_commit(lambda: generate_image_derivatives.delay(instance._meta.label, instance.pk, field_name))
+
+
+@shared_task()
+def generate_image_derivatives(model_label, pk, field_name):
+    """
+    Создание уменьшенных копий изображения в форматах IMAGE_DERIVATIVE_FORMATS
+    для ширин IMAGE_DERIVATIVE_WIDTHS, не превышающих ширину изображения
+    """
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).only(field_name).first()
+    file = getattr(instance, field_name, None)
+    if not file:
+        return 0
+
+    derivatives = {}
+    # Копии одинаковых файлов из хранилища с дедупликацией могут быть уже созданы
+    if get_derivative_widths(file.name) is None:
+        with file.open("rb"):
+            data = file.read()
+
+        widths = get_image_widths(data)
+        derivatives = render_derivatives(data, widths)
+        for (width, image_format), content in derivatives.items():
+            name = get_derivative_name(file.name, width, image_format)
+            default_storage.delete(name)
+            default_storage.save(name, ContentFile(content))
+        MediaBlob.objects.filter(name=file.name).update(derivative_widths=widths)
 
-    if subscriptions.exists():
-        users = [subscription.owner for subscription in subscriptions]
-        users_emails = [user.email for user in users]
-        send_mail("Новые материалы", message, settings.EMAIL_HOST_USER, users_emails)
+    # Ссылки на копии появляются в ответе без изменения объекта, дата изменения обновляется для ETag
+    if any(field.name == "updated_at" for field in model._meta.fields):
+        model.objects.filter(pk=pk).update(updated_at=timezone.now())
+    return len(derivatives)
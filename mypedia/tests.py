@@ -1,12 +1,30 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from billiard.pool import Pool
 from django.contrib.auth.models import Group
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from PIL import Image
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
 from rest_framework.test import APITestCase
 
+from config import celery_app, settings
+from src.images import render_derivatives
 from users.models import User
 
-from .models import Course, Lesson, Subscription
+from .models import Course, Lesson, MediaBlob, Subscription
+from .tasks import send_message_about_course_update
 
 
 # Create your tests here.
@@ -86,6 +104,41 @@ class LessonTestCase(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
+    def test_lesson_bulk_create(self):
+        """
+        Тест создания списка объектов Lesson одним запросом и одного уведомления на каждый курс
+        """
+
+        courses = [Course.objects.create(name=f"Курс {number}", owner=self.user) for number in range(2)]
+        url = reverse("mypedia:lessons-bulk")
+        data = [{"name": f"Урок {number}", "description": "Урок", "course": courses[number % 2].pk,
+                 "video_link": "https://www.youtube.com/watch?v=test"} for number in range(10)]
+
+        with patch("mypedia.views.schedule_course_update_notification") as notification:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(url, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.json()), 10)
+        self.assertTrue(all(lesson["owner"] == self.user.pk and lesson["id"] for lesson in response.json()))
+        inserts = [query for query in queries if query["sql"].startswith('INSERT INTO "mypedia_lesson"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(sorted(call.args[0] for call in notification.call_args_list),
+                         [course.pk for course in courses])
+
+        # Ссылка не на youtube.com - ни один урок не создается
+        data[-1]["video_link"] = "https://rutube.ru/video/test"
+        response = self.client.post(url, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Lesson.objects.all().count(), 12)
+
+        # Модератор
+        self.client.force_authenticate(self.moderator)
+        response = self.client.post(url, data[:1], format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
     def test_lesson_update(self):
         """
         Тест обновления объекта Lesson и корректного заполнения поля video_link
@@ -121,6 +174,113 @@ class LessonTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(data.get("video_link"), "https://www.youtube.com")
 
+    def test_lesson_preview_derivatives(self):
+        """
+        Тест создания уменьшенных копий превью урока в фоне и ссылок на них в формате srcset
+        """
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", False)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media_settings = self.settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        def upload(size):
+            image = io.BytesIO()
+            Image.new("RGB", size, "red").save(image, "PNG")
+            preview = SimpleUploadedFile("cover.png", image.getvalue(), content_type="image/png")
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.patch(url, {"preview": preview}, format="multipart")
+            return response, hashlib.sha256(image.getvalue()).hexdigest()
+
+        url = reverse("mypedia:lesson", args=[self.lesson.pk])
+        response, digest = upload((1000, 500))
+
+        # Ссылок нет, пока копии не созданы
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.json()["preview_srcset"])
+
+        srcset = self.client.get(url).json()["preview_srcset"]
+
+        blob = MediaBlob.objects.get(name=f"blobs/{digest[:2]}/{digest[2:4]}/{digest}.png")
+        self.assertEqual(blob.derivative_widths, settings.IMAGE_DERIVATIVE_WIDTHS)
+        self.assertEqual(srcset["webp"].split(", ")[0],
+                         f"http://testserver/media/derivatives/blobs/{digest[:2]}/{digest[2:4]}/{digest}_64.webp 64w")
+        for width in settings.IMAGE_DERIVATIVE_WIDTHS:
+            for image_format in settings.IMAGE_DERIVATIVE_FORMATS:
+                path = f"{media_root}/derivatives/blobs/{digest[:2]}/{digest[2:4]}/{digest}_{width}.{image_format}"
+                with Image.open(path) as derivative:
+                    self.assertEqual((derivative.format.lower(), derivative.size), (image_format, (width, width // 2)))
+
+        # Копии шире изображения не создаются
+        response, digest = upload((200, 100))
+        srcset = self.client.get(url).json()["preview_srcset"]
+
+        self.assertEqual([item.rsplit(" ", 1)[1] for item in srcset["jpeg"].split(", ")], ["64w", "160w"])
+        path = f"{media_root}/derivatives/blobs/{digest[:2]}/{digest[2:4]}/{digest}_320.webp"
+        self.assertFalse(os.path.exists(path))
+
+        # Ширины копий загружаются вместе со списком уроков
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("mypedia:lessons"))
+
+        self.assertEqual(response.json()["results"][0]["preview_srcset"], srcset)
+        self.assertFalse([query for query in queries if query["sql"].startswith('SELECT "mypedia_mediablob"')])
+
+    def test_render_derivatives_in_worker(self):
+        """
+        Тест создания уменьшенных копий в дочернем процессе worker celery (prefork),
+        которому запрещено создавать свои процессы
+        """
+        image = io.BytesIO()
+        Image.new("RGB", (200, 100), "red").save(image, "PNG")
+
+        with Pool(1) as pool:
+            derivatives = pool.apply(render_derivatives, (image.getvalue(), [64, 160]))
+
+        self.assertEqual(set(derivatives), {(width, image_format) for width in (64, 160)
+                                            for image_format in settings.IMAGE_DERIVATIVE_FORMATS})
+
+    def test_lesson_preview_deduplication(self):
+        """
+        Тест хранения одинаковых превью одним файлом с подсчетом ссылок и удаления файла без ссылок
+        """
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media_settings = self.settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        def upload(lesson, color):
+            image = io.BytesIO()
+            Image.new("RGB", (100, 100), color).save(image, "PNG")
+            preview = SimpleUploadedFile(f"{color}.png", image.getvalue(), content_type="image/png")
+            with patch("mypedia.signals.schedule_image_derivatives"):
+                self.client.patch(reverse("mypedia:lesson", args=[lesson.pk]), {"preview": preview},
+                                  format="multipart")
+            lesson.refresh_from_db()
+            return lesson.preview.name
+
+        lesson = Lesson.objects.create(name="Тестовый урок 3", owner=self.user)
+        name = upload(self.lesson, "red")
+
+        self.assertTrue(name.startswith("blobs/"))
+        self.assertEqual(upload(lesson, "red"), name)
+        self.assertEqual(MediaBlob.objects.get(name=name).references, 2)
+
+        # Замена превью и удаление урока освобождают ссылки
+        self.assertNotEqual(upload(lesson, "blue"), name)
+        self.assertEqual(MediaBlob.objects.get(name=name).references, 1)
+
+        # Файл удаляется только после фиксации транзакции
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lesson.delete()
+            self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+            self.assertTrue(os.path.exists(os.path.join(media_root, name)))
+        self.assertFalse(os.path.exists(os.path.join(media_root, name)))
+        self.assertTrue(os.path.exists(os.path.join(media_root, lesson.preview.name)))
+
     def test_invalid_video_link(self):
         """
         Тест некорректного заполнения поля video_link
@@ -178,6 +338,7 @@ class LessonTestCase(APITestCase):
                   'results': [{'id': self.lesson.pk,
                                'name': self.lesson.name,
                                'preview': self.lesson.preview,
+                               'preview_srcset': None,
                                'description': self.lesson.description,
                                'video_link': self.lesson.video_link,
                                'updated_at': self.lesson.updated_at.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
@@ -199,6 +360,7 @@ class LessonTestCase(APITestCase):
                   'results': [{'id': self.lesson.pk,
                                'name': self.lesson.name,
                                'preview': self.lesson.preview,
+                               'preview_srcset': None,
                                'description': self.lesson.description,
                                'video_link': self.lesson.video_link,
                                'updated_at': self.lesson.updated_at.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
@@ -207,6 +369,7 @@ class LessonTestCase(APITestCase):
                               {'id': self.lesson_2.pk,
                                'name': self.lesson_2.name,
                                'preview': self.lesson_2.preview,
+                               'preview_srcset': None,
                                'description': self.lesson_2.description,
                                'video_link': self.lesson_2.video_link,
                                'updated_at': self.lesson_2.updated_at.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
@@ -216,6 +379,62 @@ class LessonTestCase(APITestCase):
 
         self.assertEqual(data, result)
 
+    def test_lesson_list_cursor(self):
+        """
+        Тест курсорного постраничного вывода списка объектов Lesson без подсчета количества
+        """
+
+        for number in range(4):
+            Lesson.objects.create(name=f"Урок {number}", owner=self.user)
+
+        url = reverse("mypedia:lessons")
+        params = {"pagination": "cursor", "page_size": 2}
+        lesson_ids = []
+
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, params)
+            data = response.json()
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(list(data.keys()), ["next", "previous", "results"])
+            self.assertFalse([query for query in queries if "COUNT(" in query["sql"]])
+
+            lesson_ids += [lesson["id"] for lesson in data["results"]]
+            url, params = data["next"], None
+
+        self.assertEqual(lesson_ids, list(Lesson.objects.filter(owner=self.user).order_by("id").values_list(
+            "id", flat=True)))
+
+    def test_lesson_conditional_get(self):
+        """
+        Тест условного запроса объекта Lesson по ETag и Last-Modified
+        """
+
+        url = reverse("mypedia:lesson", args=[self.lesson.pk])
+        response = self.client.get(url)
+        etag = response["ETag"]
+        last_modified = response["Last-Modified"]
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # Данные не изменились
+        response = self.client.get(url, headers={"If-None-Match": etag})
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertFalse(response.content)
+
+        response = self.client.get(url, headers={"If-Modified-Since": last_modified})
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Данные изменились
+        self.client.patch(url, {"description": "Обновленное описание"})
+        response = self.client.get(url, headers={"If-None-Match": etag})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
 
 class CourseSubscriptionTestCase(APITestCase):
     """
@@ -245,6 +464,11 @@ class CourseSubscriptionTestCase(APITestCase):
         self.subscription = Subscription.objects.create(course=self.course, owner=self.user)
         self.subscription_2 = Subscription.objects.create(course=self.course_2, owner=self.moderator)
 
+        cache.clear()
+        patcher = patch.object(send_message_about_course_update, "apply_async")
+        self.notification = patcher.start()
+        self.addCleanup(patcher.stop)
+
         self.client.force_authenticate(self.user)
 
     def test_subscription_retrieve(self):
@@ -313,6 +537,101 @@ class CourseSubscriptionTestCase(APITestCase):
         self.assertEqual(response.json()["owner"], self.user.pk)
         self.assertEqual(Subscription.objects.all().count(), 3)
 
+        # Повторная подписка на тот же курс
+        response = self.client.post(url, data)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Subscription.objects.all().count(), 3)
+
+    def test_subscription_toggle(self):
+        """
+        Тест включения и отключения подписки текущего пользователя на курс
+        """
+
+        url = reverse("mypedia:subscriptions-toggle")
+
+        # Чужой курс недоступен пользователю
+        response = self.client.post(url, {"course": self.course_2.pk})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Subscription.objects.filter(owner=self.user, course=self.course_2).exists())
+
+        # Новая подписка модератора
+        self.client.force_authenticate(self.moderator)
+        response = self.client.post(url, {"course": self.course.pk})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {"course": self.course.pk, "is_active": True})
+        self.client.force_authenticate(self.user)
+
+        # Отключение и повторное включение существующей подписки
+        self.assertFalse(self.client.post(url, {"course": self.course.pk}).json()["is_active"])
+        self.assertFalse(Subscription.objects.get(pk=self.subscription.pk).is_active)
+        response = self.client.get(reverse("mypedia:courses-detail", args=[self.course.pk]))
+        self.assertEqual(response.json()["is_subscribed"], "Вы еще не подписаны")
+
+        self.assertTrue(self.client.post(url, {"course": self.course.pk}).json()["is_active"])
+        self.assertEqual(Subscription.objects.filter(owner=self.user).count(), 1)
+
+        # Несуществующий курс
+        response = self.client.post(url, {"course": 0})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search(self):
+        """
+        Тест полнотекстового поиска курсов и уроков с учетом словоформ, релевантности и доступа пользователя
+        """
+
+        url = reverse("mypedia:search")
+        lesson = Lesson.objects.create(name="Циклы", description="Тестовые задания по программированию",
+                                       owner=self.user)
+
+        # Обычный пользователь видит только свои курсы и уроки, название важнее описания
+        response = self.client.get(url, {"q": "тестовый"})
+        data = response.json()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([course["id"] for course in data["courses"]], [self.course.pk])
+        self.assertEqual([item["id"] for item in data["lessons"]], [self.lesson.pk, lesson.pk])
+        self.assertGreater(data["lessons"][0]["rank"], data["lessons"][1]["rank"])
+
+        # Поисковый вектор обновляется при сохранении
+        lesson.description = "Задания по алгоритмам"
+        lesson.save()
+        response = self.client.get(url, {"q": "программирование"})
+
+        self.assertEqual(response.json()["lessons"], [])
+
+        # Модератор видит все курсы
+        self.client.force_authenticate(self.moderator)
+        response = self.client.get(url, {"q": "тестовые курсы"})
+
+        self.assertEqual({course["id"] for course in response.json()["courses"]}, {self.course.pk, self.course_2.pk})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_autocomplete(self):
+        """
+        Тест подсказок по названиям курсов и уроков с кешированием ответа
+        """
+
+        url = reverse("mypedia:autocomplete")
+        lesson = Lesson.objects.create(name="Урок без теста", owner=self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {"q": "  ТЕСТ "})
+            cached = self.client.get(url, {"q": "тест"})
+        data = response.json()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(data["courses"], [{"id": self.course.pk, "name": self.course.name}])
+        self.assertEqual([item["id"] for item in data["lessons"]], [self.lesson.pk, lesson.pk])
+        self.assertEqual(cached.json(), data)
+        self.assertEqual(len([query for query in queries if "LIKE" in query["sql"]]), 2)
+
+        # Слишком короткий текст
+        self.assertEqual(self.client.get(url, {"q": "те"}).json(), {"courses": [], "lessons": []})
+
     def test_subscription_update(self):
         """
         Тест изменения объекта Subscription
@@ -527,6 +846,7 @@ class CourseSubscriptionTestCase(APITestCase):
                                'is_subscribed': 'Вы подписаны',
                                'name': self.course.name,
                                'preview': None,
+                               'preview_srcset': None,
                                'updated_at': self.course.updated_at.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
                                'description': self.course.description,
                                'owner': self.course.owner.pk}]}
@@ -547,6 +867,7 @@ class CourseSubscriptionTestCase(APITestCase):
                                'course_lessons': [{'id': self.lesson.pk,
                                                    'name': self.lesson.name,
                                                    'preview': self.lesson.preview,
+                                                   'preview_srcset': None,
                                                    'description': self.lesson.description,
                                                    'video_link': None,
                                                    'updated_at': self.lesson.updated_at.strftime(
@@ -555,8 +876,10 @@ class CourseSubscriptionTestCase(APITestCase):
                                                    'owner': self.lesson.owner.pk
                                                    }],
                                'is_subscribed': 'Вы еще не подписаны',
+                               'lessons_url': f"http://testserver/mypedia/courses/{self.course.pk}/lessons/",
                                'name': self.course.name,
                                'preview': self.course.preview,
+                               'preview_srcset': None,
                                'description': self.course.description,
                                'updated_at': self.course.updated_at.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
                                'owner': self.course.owner.pk},
@@ -564,8 +887,10 @@ class CourseSubscriptionTestCase(APITestCase):
                                'lessons_count': 0,
                                'course_lessons': [],
                                'is_subscribed': 'Вы подписаны',
+                               'lessons_url': f"http://testserver/mypedia/courses/{self.course_2.pk}/lessons/",
                                'name': self.course_2.name,
                                'preview': self.course_2.preview,
+                               'preview_srcset': None,
                                'description': self.course_2.description,
                                'updated_at': self.course_2.updated_at.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
                                'owner': None}
@@ -573,3 +898,228 @@ class CourseSubscriptionTestCase(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(data, result)
+
+    def test_course_list_queries(self):
+        """
+        Тест постоянного количества запросов к БД при выводе списка объектов Course
+        """
+
+        for number in range(10):
+            course = Course.objects.create(name=f"Курс {number}", owner=self.user)
+            Lesson.objects.create(name=f"Урок {number}", course=course, owner=self.user)
+            Subscription.objects.create(course=course, owner=self.user)
+
+        url = reverse("mypedia:courses-list")
+        self.client.get(url)  # роли пользователя попадают в кеш
+
+        with CaptureQueriesContext(connection) as small_page:
+            response = self.client.get(url, {"page_size": 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()["results"]), 1)
+
+        with CaptureQueriesContext(connection) as big_page:
+            response = self.client.get(url, {"page_size": 11})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()["results"]), 11)
+        self.assertTrue(all(course["is_subscribed"] == "Вы подписаны" for course in response.json()["results"]))
+
+        self.assertEqual(len(small_page), len(big_page))
+        self.assertFalse([query for query in big_page if "search_vector" in query["sql"]])
+
+    def test_staff_course_lessons_limit(self):
+        """
+        Тест ограничения вложенных уроков курса для модератора и постраничного списка уроков курса
+        """
+
+        for number in range(settings.COURSE_LESSONS_LIMIT + 5):
+            Lesson.objects.create(name=f"Урок {number}", course=self.course)
+
+        # Модератор - вложенные уроки ограничены
+        self.client.force_authenticate(self.moderator)
+        url = reverse("mypedia:courses-list")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        data = response.json()["results"][0]
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(data["lessons_count"], settings.COURSE_LESSONS_LIMIT + 6)
+        self.assertEqual(len(data["course_lessons"]), settings.COURSE_LESSONS_LIMIT)
+        # Вложенные уроки выбираются одним запросом, кроме запроса версии страницы для ETag
+        self.assertEqual(len([query for query in queries if 'FROM "mypedia_lesson"' in query["sql"]
+                              and "MAX(" not in query["sql"]]), 1)
+        self.assertFalse(any("ARRAY_AGG" in query["sql"] for query in queries))
+
+        # Модератор - постраничный список уроков курса без подсчета уроков курса
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(data["lessons_url"], {"page": 2})
+
+        self.assertFalse(any("ARRAY_AGG" in query["sql"] or "EXISTS" in query["sql"] for query in queries))
+        data = response.json()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(data["count"], settings.COURSE_LESSONS_LIMIT + 6)
+        self.assertEqual(len(data["results"]), 6)
+
+        # Обычный пользователь - чужой курс
+        self.client.force_authenticate(self.user)
+        url = reverse("mypedia:courses-lessons", args=[self.course_2.pk])
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_course_list_conditional_get(self):
+        """
+        Тест условного запроса списка объектов Course с учетом подписки пользователя
+        """
+
+        self.client.force_authenticate(self.moderator)
+        url = reverse("mypedia:courses-list")
+        response = self.client.get(url)
+        etag = response["ETag"]
+
+        self.assertNotIn("Last-Modified", response)
+
+        # Данные не изменились
+        response = self.client.get(url, headers={"If-None-Match": etag})
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Изменилась подписка пользователя
+        Subscription.objects.create(course=self.course, owner=self.moderator)
+        response = self.client.get(url, headers={"If-None-Match": etag})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        etag = response["ETag"]
+
+        # Удален урок курса
+        self.lesson.delete()
+        response = self.client.get(url, headers={"If-None-Match": etag})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["results"][0]["lessons_count"], 0)
+
+    def test_course_conditional_get(self):
+        """
+        Тест условного запроса объекта Course только по ETag с учетом подписки пользователя и удаления уроков
+        """
+
+        url = reverse("mypedia:courses-detail", args=[self.course.pk])
+        response = self.client.get(url)
+        etag = response["ETag"]
+
+        self.assertNotIn("Last-Modified", response)
+
+        # Данные не изменились, курс с подсчетом уроков не выбирается
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, headers={"If-None-Match": etag})
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertFalse(any("ARRAY_AGG" in query["sql"] for query in queries.captured_queries))
+
+        # If-Modified-Since не учитывается
+        response = self.client.get(url, headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # Отключена подписка пользователя
+        self.client.post(reverse("mypedia:subscriptions-toggle"), {"course": self.course.pk})
+        response = self.client.get(url, headers={"If-None-Match": etag})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["is_subscribed"], "Вы еще не подписаны")
+        etag = response["ETag"]
+
+        # Удален урок курса
+        self.lesson.delete()
+        response = self.client.get(url, headers={"If-None-Match": etag})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["lessons_count"], 0)
+
+        # Чужой курс недоступен и при условном запросе
+        response = self.client.get(reverse("mypedia:courses-detail", args=[self.course_2.pk]),
+                                   headers={"If-None-Match": etag})
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @patch.object(settings, "COURSE_UPDATE_MAIL_CHUNK_SIZE", 2)
+    def test_course_update_notification(self):
+        """
+        Тест рассылки уведомления об обновлении курса отдельными письмами пачками подписчиков
+        """
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", False)
+
+        for number in range(3):
+            user = User.objects.create(email=f"subscriber{number}@email.com")
+            Subscription.objects.create(course=self.course, owner=user)
+        Subscription.objects.create(course=self.course, owner=self.moderator, is_active=False)
+
+        with self.assertNumQueries(2):
+            send_message_about_course_update(self.course.pk)
+
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertTrue(all(len(message.to) == 1 for message in mail.outbox))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ["subscriber0@email.com", "subscriber1@email.com", "subscriber2@email.com", "test@email.com"])
+
+    def test_course_update_notification_deleted_course(self):
+        """
+        Тест отложенного уведомления об обновлении курса, удаленного за время окна
+        """
+
+        course_id = self.course.pk
+        self.course.delete()
+        send_message_about_course_update(course_id)
+
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_course_update_notification_window(self):
+        """
+        Тест объединения изменений курса в одно уведомление в пределах окна
+        """
+
+        self.client.patch(reverse("mypedia:courses-detail", args=[self.course.pk]), {"description": "Новое описание"})
+        self.client.patch(reverse("mypedia:lesson", args=[self.lesson.pk]), {"description": "Новое описание"})
+        self.client.post(reverse("mypedia:lessons"), {"name": "Тестовый урок 2", "course": self.course.pk})
+
+        self.notification.assert_called_once_with((self.course.pk,),
+                                                  countdown=settings.COURSE_UPDATE_NOTIFICATION_WINDOW)
+
+        # После окончания окна изменения снова приводят к уведомлению
+        cache.delete(f"mypedia:course_update:{self.course.pk}")
+        self.client.patch(reverse("mypedia:lesson", args=[self.lesson.pk]), {"description": "Описание"})
+
+        self.assertEqual(self.notification.call_count, 2)
+
+
+class AutocompleteIndexTestCase(TestCase):
+    """
+    Тестирование использования триграммных индексов в запросах подсказок
+    """
+
+    def setUp(self):
+        """
+        Подготовка исходных данных, последовательное чтение таблиц запрещено:
+        на маленькой таблице планировщик выбрал бы его вместо индекса
+        """
+
+        Course.objects.bulk_create([Course(name=f"Тестовый курс {number}") for number in range(10)])
+        Lesson.objects.bulk_create([Lesson(name=f"Тестовый урок {number}") for number in range(10)])
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE mypedia_course")
+            cursor.execute("ANALYZE mypedia_lesson")
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def assertUsesIndex(self, queryset, index_name):
+        self.assertIn(index_name, queryset.explain())
+
+    def test_name_trgm_indexes(self):
+        """
+        Тест поиска по подстроке и началу названия без учета регистра
+        """
+
+        self.assertUsesIndex(Course.objects.filter(name__icontains="вый к"), "mypedia_course_uname_trgm_idx")
+        self.assertUsesIndex(Course.objects.filter(name__istartswith="тест"), "mypedia_course_uname_trgm_idx")
+        self.assertUsesIndex(Lesson.objects.filter(name__icontains="вый у"), "mypedia_lesson_uname_trgm_idx")
@@ -11,8 +11,13 @@ router.register("courses", views.CourseViewSet, basename="courses")
 
 urlpatterns = [
     path("lessons/", views.LessonListCreateAPIView.as_view(), name="lessons"),
+    path("lessons/bulk/", views.LessonBulkCreateAPIView.as_view(), name="lessons-bulk"),
     path("lessons/<int:pk>/", views.LessonRetrieveUpdateDestroyAPIView.as_view(), name="lesson"),
 
+    path("search/", views.SearchAPIView.as_view(), name="search"),
+    path("autocomplete/", views.AutocompleteAPIView.as_view(), name="autocomplete"),
+
     path("subscriptions/", views.SubscriptionListCreateAPIView.as_view(), name="subscriptions"),
+    path("subscriptions/toggle/", views.SubscriptionToggleAPIView.as_view(), name="subscriptions-toggle"),
     path("subscriptions/<int:pk>/", views.SubscriptionRetrieveUpdateDestroyAPIView.as_view(), name="subscription"),
 ] + router.urls
@@ -1,24 +1,40 @@
-from django.contrib.auth.models import Group
+from hashlib import md5
+
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Case, Count, Exists, F, Max, OuterRef, Prefetch, Q, Value, When
+from django.utils import timezone
 from rest_framework import generics, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
 
+from config import settings
+from src.images import annotate_derivative_widths
 from src.utils import get_queryset_for_owner
 from users.permissions import IsModerator, IsOwner
+from users.roles import is_staff_member
 
-from .models import Course, Lesson, Subscription
-from .paginators import CoursePaginator, LessonPaginator
-from .serializers import CourseSerializer, LessonSerializer, StaffCourseSerializer, SubscriptionSerializer
-from .tasks import send_message_about_course_update
+from .mixins import ConditionalGetMixin
+from .models import SEARCH_CONFIG, Course, Lesson, Subscription
+from .paginators import CoursePaginator, CursorPaginator, LessonPaginator
+from .serializers import (CourseSerializer, LessonSerializer, StaffCourseSerializer, SubscriptionSerializer,
+                          SubscriptionToggleSerializer)
+from .tasks import schedule_course_update_notification
 
 
 # Create your views here.
-class CourseViewSet(viewsets.ModelViewSet):
+class CourseViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     Вьюсет для CRUD операций с моделью Course
     """
     queryset = Course.objects.all()
     serializer_class = CourseSerializer
     pagination_class = CoursePaginator
+    retrieve_last_modified = False
 
     def get_permissions(self):
         """
@@ -26,7 +42,7 @@ class CourseViewSet(viewsets.ModelViewSet):
         """
         if self.action == "create":
             self.permission_classes = [~IsModerator]
-        elif self.action in ["update", "retrieve"]:
+        elif self.action in ["update", "retrieve", "lessons"]:
             self.permission_classes = [IsOwner | IsModerator | IsAdminUser]
         elif self.action == "destroy":
             self.permission_classes = [IsOwner | IsAdminUser]
@@ -35,9 +51,47 @@ class CourseViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """
         Подбор списка объектов в зависимости от статуса пользователя
+        с подсчетом уроков и проверкой подписки одним запросом, ID уроков собираются
+        только для сериализатора обычного пользователя, для списка уроков курса аннотации не нужны
+        """
+        queryset = get_queryset_for_owner(self.request.user, self.queryset)
+        if self.action == "lessons":
+            return queryset
+        subscriptions = Subscription.objects.filter(owner=self.request.user.pk, course=OuterRef("pk"), is_active=True)
+        queryset = queryset.annotate(lessons_total=Count("lessons"), subscribed=Exists(subscriptions))
+        if self.get_serializer_class() is StaffCourseSerializer:
+            lessons = annotate_derivative_widths(Lesson.objects.order_by("id"), "preview")
+            lessons = lessons[:settings.COURSE_LESSONS_LIMIT]
+            queryset = queryset.prefetch_related(Prefetch("lessons", queryset=lessons, to_attr="preview_lessons"))
+        else:
+            queryset = queryset.annotate(lesson_ids=ArrayAgg("lessons__id", filter=Q(lessons__isnull=False),
+                                                             ordering="lessons__id", default=[]))
+        if self.request.method == "GET":
+            queryset = annotate_derivative_widths(queryset, "preview")
+        return queryset
+
+    def get_version_queryset(self):
+        """
+        Доступные пользователю курсы без подсчета уроков и проверки подписки
         """
         return get_queryset_for_owner(self.request.user, self.queryset)
 
+    def get_version(self, objects):
+        """
+        Дата последнего изменения курсов и их уроков, а также состояние подписок пользователя на эти курсы:
+        подписка и удаление урока не меняют дату, поэтому ответы курсов отдаются только с ETag
+        """
+        last_modified, parts = super().get_version(objects)
+        course_ids = [course.pk for course in objects]
+        lessons = Lesson.objects.filter(course__in=course_ids).aggregate(last_modified=Max("updated_at"),
+                                                                         total=Count("pk"))
+        subscriptions = Subscription.objects.filter(owner=self.request.user.pk, course__in=course_ids).aggregate(
+            total=Count("pk"), active=Count("pk", filter=Q(is_active=True)), last=Max("pk"))
+
+        dates = [date for date in (last_modified, lessons["last_modified"]) if date]
+        return max(dates, default=None), [*parts, lessons["total"], subscriptions["total"], subscriptions["active"],
+                                          subscriptions["last"]]
+
     def perform_create(self, serializer):
         """
         Сохранение владельца при создании объекта
@@ -50,24 +104,31 @@ class CourseViewSet(viewsets.ModelViewSet):
         """
         Отправка подписавшимся пользователям уведомления об обновлении курса
         """
-        previous_update_date = self.get_object().updated_at
         course = serializer.save()
-        current_update_date = course.updated_at
-        if (current_update_date - previous_update_date).seconds >= 4 * 60 * 60:
-            send_message_about_course_update.delay(course.pk)
+        schedule_course_update_notification(course.pk)
+
+    @action(detail=True, methods=["get"], pagination_class=LessonPaginator)
+    def lessons(self, request, pk=None):
+        """
+        Постраничный список уроков курса
+        """
+        course = self.get_object()
+        page = self.paginate_queryset(annotate_derivative_widths(course.lessons.order_by("id"), "preview"))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     def get_serializer_class(self):
         """
         Подбор сериализатора в зависимости от статуса пользователя
         """
-        try:
-            if self.request.user.is_superuser or self.request.user.groups.get(name="Moderators"):
-                return StaffCourseSerializer
-        except Group.DoesNotExist:
-            return CourseSerializer
+        if self.action == "lessons":
+            return LessonSerializer
+        if is_staff_member(self.request.user):
+            return StaffCourseSerializer
+        return CourseSerializer
 
 
-class LessonListCreateAPIView(generics.ListCreateAPIView):
+class LessonListCreateAPIView(ConditionalGetMixin, generics.ListCreateAPIView):
     """
     Дженерик для отображения списка и создания нового объекта Lesson:
     """
@@ -87,25 +148,45 @@ class LessonListCreateAPIView(generics.ListCreateAPIView):
         """
         Подбор списка объектов в зависимости от статуса пользователя
         """
-        return get_queryset_for_owner(self.request.user, self.queryset)
+        return annotate_derivative_widths(get_queryset_for_owner(self.request.user, self.queryset), "preview")
 
     def perform_create(self, serializer):
         """
         Сохранение владельца при создании объекта и отправка уведомления подписанным пользователям об изменении курса
         """
-        lesson = serializer.save()
-        lesson.owner = self.request.user
-        lesson.save()
+        lesson = serializer.save(owner=self.request.user)
+
+        if lesson.course_id:
+            schedule_course_update_notification(lesson.course_id)
+
 
-        course = lesson.course
-        if course:
-            previous_update_date = course.updated_at
-            current_update_date = lesson.updated_at
-            if (current_update_date - previous_update_date).seconds >= 4 * 60 * 60:
-                send_message_about_course_update.delay(course.pk)
+class LessonBulkCreateAPIView(generics.CreateAPIView):
+    """
+    Дженерик для создания списка объектов Lesson одной транзакцией:
+    """
+    queryset = Lesson.objects.all()
+    serializer_class = LessonSerializer
+    permission_classes = [~IsModerator]
+
+    def get_serializer(self, *args, **kwargs):
+        """
+        Сериализатор списка уроков, количество ограничено настройкой LESSON_BULK_MAX_SIZE
+        """
+        return super().get_serializer(*args, many=True, allow_empty=False,
+                                      max_length=settings.LESSON_BULK_MAX_SIZE, **kwargs)
+
+    def perform_create(self, serializer):
+        """
+        Сохранение уроков с владельцем и одно уведомление подписанным пользователям на каждый измененный курс
+        """
+        with transaction.atomic():
+            lessons = serializer.save(owner=self.request.user)
+
+        for course_id in {lesson.course_id for lesson in lessons if lesson.course_id}:
+            schedule_course_update_notification(course_id)
 
 
-class LessonRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
+class LessonRetrieveUpdateDestroyAPIView(ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     Дженерик для просмотра, редактирования и удаления объекта Lesson:
     """
@@ -122,18 +203,86 @@ class LessonRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
             self.permission_classes = [IsOwner | IsAdminUser]
         return super().get_permissions()
 
+    def get_queryset(self):
+        """
+        Ширины уменьшенных копий превью загружаются вместе с уроком только для просмотра:
+        после замены превью они бы устарели
+        """
+        queryset = super().get_queryset()
+        if self.request.method == "GET":
+            queryset = annotate_derivative_widths(queryset, "preview")
+        return queryset
+
     def perform_update(self, serializer):
         """
         Отправка уведомления подписанным пользователям об изменении курса
         """
         lesson = serializer.save()
 
-        course = lesson.course
-        if course:
-            previous_update_date = course.updated_at
-            current_update_date = lesson.updated_at
-            if (current_update_date - previous_update_date).seconds >= 4 * 60 * 60:
-                send_message_about_course_update.delay(course.pk)
+        if lesson.course_id:
+            schedule_course_update_notification(lesson.course_id)
+
+
+class SearchAPIView(generics.GenericAPIView):
+    """
+    Полнотекстовый поиск по названиям и описаниям доступных пользователю курсов и уроков (параметр q),
+    результаты упорядочены по релевантности
+    """
+
+    def search(self, queryset, query):
+        """
+        Наиболее релевантные объекты, количество ограничено настройкой SEARCH_RESULTS_LIMIT
+        """
+        queryset = get_queryset_for_owner(self.request.user, queryset).filter(search_vector=query)
+        queryset = queryset.annotate(rank=SearchRank(F("search_vector"), query)).order_by("-rank", "id")
+        return list(queryset.values("id", "name", "description", "rank")[:settings.SEARCH_RESULTS_LIMIT])
+
+    def get(self, request, *args, **kwargs):
+        """
+        Поиск курсов и уроков по запросу
+        """
+        text = request.query_params.get("q", "").strip()
+        if not text:
+            raise ValidationError({"q": "Не указан поисковый запрос"})
+
+        query = SearchQuery(text, config=SEARCH_CONFIG, search_type="websearch")
+        return Response({"courses": self.search(Course.objects.all(), query),
+                         "lessons": self.search(Lesson.objects.all(), query)})
+
+
+class AutocompleteAPIView(generics.GenericAPIView):
+    """
+    Подсказки по названиям доступных пользователю курсов и уроков при вводе (параметр q):
+    поиск по подстроке без учета регистра использует триграммные индексы по UPPER(name),
+    ответы кешируются на AUTOCOMPLETE_CACHE_TIMEOUT
+    """
+
+    def suggest(self, queryset, text):
+        """
+        ID и названия объектов, сначала начинающиеся с введенного текста
+        """
+        queryset = get_queryset_for_owner(self.request.user, queryset).filter(name__icontains=text)
+        queryset = queryset.annotate(
+            is_prefix=Case(When(name__istartswith=text, then=Value(0)), default=Value(1))
+        ).order_by("is_prefix", "name", "id")
+        return list(queryset.values("id", "name")[:settings.AUTOCOMPLETE_LIMIT])
+
+    def get(self, request, *args, **kwargs):
+        """
+        Подсказки для введенного текста из кеша или из БД
+        """
+        text = " ".join(request.query_params.get("q", "").split()).lower()
+        if len(text) < settings.AUTOCOMPLETE_MIN_LENGTH:
+            return Response({"courses": [], "lessons": []})
+
+        scope = "staff" if is_staff_member(request.user) else request.user.pk
+        key = f"mypedia:autocomplete:{scope}:{md5(text.encode(), usedforsecurity=False).hexdigest()}"
+        suggestions = cache.get(key)
+        if suggestions is None:
+            suggestions = {"courses": self.suggest(Course.objects.all(), text),
+                           "lessons": self.suggest(Lesson.objects.all(), text)}
+            cache.set(key, suggestions, settings.AUTOCOMPLETE_CACHE_TIMEOUT)
+        return Response(suggestions)
 
 
 class SubscriptionListCreateAPIView(generics.ListCreateAPIView):
@@ -142,6 +291,7 @@ class SubscriptionListCreateAPIView(generics.ListCreateAPIView):
     """
     queryset = Subscription.objects.all()
     serializer_class = SubscriptionSerializer
+    pagination_class = CursorPaginator
 
     def get_permissions(self):
         """
@@ -158,6 +308,36 @@ class SubscriptionListCreateAPIView(generics.ListCreateAPIView):
         return get_queryset_for_owner(self.request.user, self.queryset)
 
 
+class SubscriptionToggleAPIView(generics.GenericAPIView):
+    """
+    Включение и отключение подписки текущего пользователя на доступный ему курс
+    одним запросом INSERT ... ON CONFLICT:
+    """
+    serializer_class = SubscriptionToggleSerializer
+
+    def post(self, request, *args, **kwargs):
+        """
+        Создание активной подписки или переключение существующей
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        course = serializer.validated_data["course"]
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {Subscription._meta.db_table} (owner_id, course_id, is_active, created_at)
+                VALUES (%s, %s, TRUE, %s)
+                ON CONFLICT (owner_id, course_id) DO UPDATE SET is_active = NOT {Subscription._meta.db_table}.is_active
+                RETURNING is_active
+                """,
+                [request.user.pk, course.pk, timezone.localdate()],
+            )
+            is_active = cursor.fetchone()[0]
+
+        return Response({"course": course.pk, "is_active": is_active})
+
+
 class SubscriptionRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
     """
     Дженерик для просмотра, редактирования и удаления объекта Subscription:
@@ -0,0 +1,104 @@
+import io
+from itertools import product
+from pathlib import PurePosixPath
+
+from django.core.files.storage import default_storage
+from django.db.models import OuterRef, Subquery
+from PIL import ExifTags, Image, ImageOps
+
+from config import settings
+from mypedia.models import MediaBlob
+
+IMAGE_FORMATS = {"webp": "WEBP", "jpeg": "JPEG"}
+
+
+def get_derivative_name(name, width, image_format):
+    """
+    Путь уменьшенной копии изображения заданной ширины и формата
+    """
+    path = PurePosixPath(name)
+    return str(PurePosixPath("derivatives") / path.parent / f"{path.stem}_{width}.{image_format}")
+
+
+def get_derivative_names(name):
+    """
+    Пути всех уменьшенных копий изображения
+    """
+    return [get_derivative_name(name, width, image_format)
+            for width, image_format in product(settings.IMAGE_DERIVATIVE_WIDTHS, settings.IMAGE_DERIVATIVE_FORMATS)]
+
+
+def get_derivative_widths(name):
+    """
+    Ширины созданных уменьшенных копий изображения, None пока копии не созданы
+    """
+    return MediaBlob.objects.filter(name=name).values_list("derivative_widths", flat=True).first()
+
+
+def annotate_derivative_widths(queryset, field_name):
+    """
+    Ширины созданных уменьшенных копий изображения из поля field_name в атрибуте <field_name>_widths
+    для вывода srcset без запроса на каждый объект
+    """
+    blobs = MediaBlob.objects.filter(name=OuterRef(field_name)).values("derivative_widths")[:1]
+    return queryset.annotate(**{f"{field_name}_widths": Subquery(blobs)})
+
+
+def get_image_widths(data):
+    """
+    Ширины уменьшенных копий, не превышающие ширину изображения с учетом поворота по EXIF
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        width, height = image.size
+        if image.getexif().get(ExifTags.Base.Orientation) in (5, 6, 7, 8):
+            width = height
+    return [derivative_width for derivative_width in settings.IMAGE_DERIVATIVE_WIDTHS if derivative_width <= width]
+
+
+def render_derivative(data, width, image_format):
+    """
+    Уменьшенная копия изображения: ширина не больше заданной, пропорции сохраняются
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((width, image.height))
+        if image_format == "jpeg" and image.mode != "RGB":
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+
+        buffer = io.BytesIO()
+        image.save(buffer, IMAGE_FORMATS[image_format], quality=settings.IMAGE_DERIVATIVE_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def render_derivatives(data, widths):
+    """
+    Уменьшенные копии изображения заданных ширин, обрабатываются в текущем процессе:
+    задача выполняется в дочернем процессе worker celery, который не может создавать свои процессы,
+    параллельность обеспечивается количеством процессов worker
+    """
+    return {(width, image_format): render_derivative(data, width, image_format)
+            for width, image_format in product(widths, settings.IMAGE_DERIVATIVE_FORMATS)}
+
+
+def get_srcset(instance, field_name, request=None):
+    """
+    Значения srcset по форматам для созданных уменьшенных копий изображения из поля field_name,
+    None при отсутствии изображения, пока копии не созданы или если изображение уже самой малой ширины
+    """
+    file = getattr(instance, field_name)
+    if not file:
+        return None
+    widths_attr = f"{field_name}_widths"
+    widths = getattr(instance, widths_attr) if hasattr(instance, widths_attr) else get_derivative_widths(file.name)
+    if not widths:
+        return None
+    srcset = {}
+    for image_format in settings.IMAGE_DERIVATIVE_FORMATS:
+        urls = []
+        for width in widths:
+            url = default_storage.url(get_derivative_name(file.name, width, image_format))
+            urls.append(f"{request.build_absolute_uri(url) if request else url} {width}w")
+        srcset[image_format] = ", ".join(urls)
+    return srcset
@@ -0,0 +1,60 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.storage import FileSystemStorage, storages
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файловое хранилище, сохраняющее содержимое один раз под его хешем sha256:
+    одинаковые файлы получают одно и то же имя независимо от исходного имени
+    """
+    prefix = "blobs"
+
+    def get_blob_name(self, digest, name):
+        """
+        Путь файла по хешу содержимого с расширением исходного файла
+        """
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(self.prefix, digest[:2], digest[2:4], f"{digest}{extension}")
+
+    def get_available_name(self, name, max_length=None):
+        """
+        Имя определяется содержимым при сохранении, подбор свободного имени не нужен
+        """
+        return name
+
+    def _save(self, name, content):
+        """
+        Запись во временный файл с подсчетом хеша по частям и перенос под имя по хешу,
+        если такого содержимого еще нет
+        """
+        directory = self.path(self.prefix)
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+
+            blob_name = self.get_blob_name(digest.hexdigest(), name)
+            path = self.path(blob_name)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.chmod(temp_path, self.file_permissions_mode or 0o644)
+                os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return blob_name
+
+
+def get_blob_storage():
+    """
+    Хранилище загружаемых изображений с дедупликацией по содержимому
+    """
+    return storages["blobs"]
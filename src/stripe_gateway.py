@@ -0,0 +1,215 @@
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+import requests
+import stripe
+from requests.adapters import HTTPAdapter
+
+from config import settings
+
+
+class CircuitOpenError(stripe.APIConnectionError):
+    """
+    Запрос к stripe отклонен без обращения к API: stripe недоступен
+    """
+
+
+class CircuitBreaker:
+    """
+    Размыкатель цепи: после серии ошибок подряд запросы отклоняются сразу, по истечении
+    reset_timeout пропускается один пробный запрос, успех которого замыкает цепь
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if self.trial or time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        """
+        Можно ли выполнить запрос
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.trial or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.trial = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures, self.opened_at, self.trial = 0, None, False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.failure_threshold:
+                self.opened_at, self.trial = time.monotonic(), False
+
+    def record_error(self):
+        """
+        Ошибка, не связанная с доступностью stripe: учитывается только во время пробного запроса,
+        который иначе остался бы незавершенным
+        """
+        with self.lock:
+            if self.trial:
+                self.opened_at, self.trial = time.monotonic(), False
+
+
+class StripeMetrics:
+    """
+    Счетчики вызовов API stripe: количество, ошибки, повторы и задержка по операциям
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.operations = defaultdict(lambda: {"calls": 0, "errors": 0, "retries": 0, "rejected": 0,
+                                               "latency_total": 0.0, "latency_max": 0.0})
+
+    def record_call(self, operation, latency, error=None):
+        with self.lock:
+            data = self.operations[operation]
+            data["calls"] += 1
+            data["latency_total"] += latency
+            data["latency_max"] = max(data["latency_max"], latency)
+            if error is not None:
+                data["errors"] += 1
+                data.setdefault("error_types", defaultdict(int))[type(error).__name__] += 1
+
+    def record_retry(self, operation):
+        with self.lock:
+            self.operations[operation]["retries"] += 1
+
+    def record_rejected(self, operation):
+        with self.lock:
+            self.operations[operation]["rejected"] += 1
+
+    def snapshot(self):
+        """
+        Текущие значения метрик со средней задержкой по операциям
+        """
+        with self.lock:
+            result = {}
+            for operation, data in self.operations.items():
+                result[operation] = {**data, "error_types": dict(data.get("error_types", {})),
+                                     "latency_avg": data["latency_total"] / data["calls"] if data["calls"] else 0.0}
+            return result
+
+    def reset(self):
+        with self.lock:
+            self.operations.clear()
+
+
+class StripeGateway:
+    """
+    Клиент API stripe с пулом соединений, таймаутами, повторами с ключами идемпотентности
+    и размыкателем цепи
+    """
+
+    def __init__(self, api_key=None, api_base=None, timeout=None, connect_timeout=None, max_retries=None,
+                 retry_backoff=None, pool_size=None, breaker=None):
+        self.api_key = api_key or settings.STRIPE_API_KEY
+        self.api_base = api_base or stripe.api_base
+        self.timeout = timeout or settings.STRIPE_TIMEOUT
+        self.connect_timeout = connect_timeout or settings.STRIPE_CONNECT_TIMEOUT
+        self.max_retries = settings.STRIPE_MAX_RETRIES if max_retries is None else max_retries
+        self.retry_backoff = settings.STRIPE_RETRY_BACKOFF if retry_backoff is None else retry_backoff
+        self.breaker = breaker or CircuitBreaker(settings.STRIPE_BREAKER_THRESHOLD,
+                                                 settings.STRIPE_BREAKER_RESET_TIMEOUT)
+        self.metrics = StripeMetrics()
+
+        pool_size = pool_size or settings.STRIPE_POOL_SIZE
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def get_client(self, timeout):
+        """
+        Клиент stripe для заданного таймаута, все клиенты используют общий пул соединений
+        """
+        key = (self.api_key, self.api_base, timeout)
+        with self.lock:
+            if key not in self.clients:
+                http_client = stripe.RequestsClient(session=self.session, timeout=(self.connect_timeout, timeout))
+                self.clients[key] = stripe.StripeClient(self.api_key, base_addresses={"api": self.api_base},
+                                                        http_client=http_client, max_network_retries=0)
+            return self.clients[key]
+
+    @staticmethod
+    def is_retryable(error):
+        """
+        Ошибки, при которых запрос имеет смысл повторить и которые говорят о недоступности stripe
+        """
+        if isinstance(error, (stripe.APIConnectionError, stripe.RateLimitError)):
+            return True
+        return isinstance(error, stripe.APIError) and (error.http_status or 500) >= 500
+
+    def get_retry_delay(self, attempt):
+        """
+        Экспоненциальная задержка перед повтором со случайным разбросом
+        """
+        return random.uniform(0, self.retry_backoff * 2 ** attempt)
+
+    def call(self, operation, *args, params=None, idempotency_key=None, timeout=None):
+        """
+        Вызов операции API stripe вида "checkout.sessions.create", создающие запросы выполняются
+        с ключом идемпотентности, общим для всех повторов
+        """
+        method = operation.rsplit(".", 1)[-1]
+        options = {}
+        if method not in ("retrieve", "list"):
+            options["idempotency_key"] = idempotency_key or str(uuid.uuid4())
+
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self.metrics.record_rejected(operation)
+                raise CircuitOpenError(f"Stripe is unavailable, {operation} rejected")
+
+            started = time.monotonic()
+            try:
+                target = self.get_client(timeout or self.timeout)
+                for name in operation.split("."):
+                    target = getattr(target, name)
+                result = target(*args, params=params or {}, options=options)
+            except stripe.StripeError as error:
+                self.metrics.record_call(operation, time.monotonic() - started, error)
+                if not self.is_retryable(error):
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    raise
+                self.metrics.record_retry(operation)
+                time.sleep(self.get_retry_delay(attempt))
+                attempt += 1
+            except BaseException:
+                # Любая другая ошибка, в том числе прерывание задачи по таймауту, не должна оставить
+                # цепь в состоянии пробного запроса
+                self.breaker.record_error()
+                raise
+            else:
+                self.metrics.record_call(operation, time.monotonic() - started)
+                self.breaker.record_success()
+                return result
+
+
+gateway = StripeGateway()
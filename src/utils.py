@@ -1,20 +1,77 @@
-import stripe
-from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
 
-from config.settings import STRIPE_API_KEY
+from config import settings
+from mypedia.models import MediaBlob, StripePrice
+from src.images import get_derivative_names
+from src.storage import get_blob_storage
+from src.stripe_gateway import gateway
+from users.roles import is_staff_member
 
-stripe.api_key = STRIPE_API_KEY
+STRIPE_CURRENCY = "rub"
 
 
 def get_queryset_for_owner(user, queryset):
     """
     Выборка списка объектов только для их владельцев
     """
+    if is_staff_member(user):
+        return queryset.order_by("id")
+    return queryset.filter(owner=user.pk).order_by("id")
+
+
+def retain_media(name):
+    """
+    Увеличение количества ссылок на файл хранилища с дедупликацией
+    """
+    if MediaBlob.objects.filter(name=name).update(references=F("references") + 1):
+        return
     try:
-        if user.is_superuser or user.groups.get(name="Moderators"):
-            return queryset.order_by("id")
-    except Group.DoesNotExist:
-        return queryset.filter(owner=user).order_by("id")
+        with transaction.atomic():
+            MediaBlob.objects.create(name=name, references=1)
+    except IntegrityError:
+        MediaBlob.objects.filter(name=name).update(references=F("references") + 1)
+
+
+def release_media(name):
+    """
+    Уменьшение количества ссылок на файл, файл и его уменьшенные копии удаляются после фиксации транзакции,
+    в которой удалена последняя ссылка
+    """
+    with transaction.atomic():
+        blob = MediaBlob.objects.select_for_update().filter(name=name).first()
+        if blob is None:
+            return
+        if blob.references > 1:
+            MediaBlob.objects.filter(pk=blob.pk).update(references=F("references") - 1)
+            return
+        blob.delete()
+    transaction.on_commit(lambda: delete_media(name))
+
+
+def delete_media(name):
+    """
+    Удаление файла и его уменьшенных копий из хранилища, если на файл снова не появились ссылки
+    """
+    if MediaBlob.objects.filter(name=name).exists():
+        return
+    get_blob_storage().delete(name)
+    for derivative_name in get_derivative_names(name):
+        default_storage.delete(derivative_name)
+
+
+def update_media_references(old_name, new_name):
+    """
+    Перенос ссылки при замене файла в поле модели
+    """
+    if old_name == new_name:
+        return
+    if new_name:
+        retain_media(new_name)
+    if old_name:
+        release_media(old_name)
 
 
 def create_stripe_product(instance):
@@ -23,29 +80,71 @@ def create_stripe_product(instance):
     """
     instance_name = f"Оплата курса {instance.course.name}" if instance.course \
         else f"Оплата урока {instance.lesson.name}"
-    return stripe.Product.create(name=instance_name)
+    return gateway.call("products.create", params={"name": instance_name})
 
 
-def create_stripe_price(instance):
+def create_stripe_price(instance, product_id):
     """
     Создание цены в stripe
     """
-    return stripe.Price.create(
-        currency="rub",
-        unit_amount=instance.amount * 100,
-        product=create_stripe_product(instance).get("id"),
-    )
+    return gateway.call("prices.create", params={
+        "currency": STRIPE_CURRENCY,
+        "unit_amount": instance.amount * 100,
+        "product": product_id,
+    })
+
+
+def get_stripe_price_cache_key(field, object_id, amount, currency):
+    """
+    Ключ кеша цены stripe для курса или урока
+    """
+    return f"stripe:price:{field}:{object_id}:{amount}:{currency}"
+
+
+def get_or_create_stripe_price(instance):
+    """
+    Получение ID цены stripe для оплачиваемого курса или урока из каталога,
+    продукт и цена в stripe создаются только при отсутствии в каталоге
+    """
+    field = "course" if instance.course_id else "lesson"
+    object_id = getattr(instance, f"{field}_id")
+    lookup = {f"{field}_id": object_id, "amount": instance.amount, "currency": STRIPE_CURRENCY}
+    key = get_stripe_price_cache_key(field, object_id, instance.amount, STRIPE_CURRENCY)
+
+    price_id = cache.get(key)
+    if price_id:
+        return price_id
+
+    catalog_price = StripePrice.objects.filter(**lookup).first()
+    if catalog_price is None:
+        product = create_stripe_product(instance)
+        price = create_stripe_price(instance, product.get("id"))
+        catalog_price, _ = StripePrice.objects.get_or_create(
+            **lookup, defaults={"product_id": product.get("id"), "price_id": price.get("id")})
+
+    cache.set(key, catalog_price.price_id, settings.STRIPE_PRICE_CACHE_TIMEOUT)
+    return catalog_price.price_id
+
+
+def invalidate_stripe_prices(field, instance):
+    """
+    Удаление из каталога и кеша цен stripe курса или урока
+    """
+    prices = StripePrice.objects.filter(**{field: instance})
+    cache.delete_many([get_stripe_price_cache_key(field, instance.pk, price.amount, price.currency)
+                       for price in prices])
+    prices.delete()
 
 
-def create_stripe_session(price):
+def create_stripe_session(price_id, idempotency_key=None):
     """
     Создание сессии на оплату в stripe
     """
-    session = stripe.checkout.Session.create(
-        success_url="https://127.0.0.1:8000/payments/",
-        line_items=[{"price": price.get("id"), "quantity": 1}],
-        mode="payment",
-    )
+    session = gateway.call("checkout.sessions.create", params={
+        "success_url": "https://127.0.0.1:8000/payments/",
+        "line_items": [{"price": price_id, "quantity": 1}],
+        "mode": "payment",
+    }, idempotency_key=idempotency_key)
     return session.get("id"), session.get("url")
 
 
@@ -53,4 +152,4 @@ def check_session_status(session_id):
     """
     Уточнение статуса сессии
     """
-    return stripe.checkout.Session.retrieve(session_id).get("payment_status")
+    return gateway.call("checkout.sessions.retrieve", session_id).get("payment_status")
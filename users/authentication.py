@@ -0,0 +1,93 @@
+import time
+
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+from config import settings
+
+from .models import User
+from .roles import get_user_roles
+
+
+def get_revocation_cache_key(user_id):
+    """
+    Ключ кеша времени отзыва токенов пользователя
+    """
+    return f"users:tokens_revoked:{user_id}"
+
+
+def revoke_user_tokens(*user_ids):
+    """
+    Отзыв выданных ранее access-токенов пользователей: данные в них (роли, статус) устарели
+    """
+    timeout = int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+    revoked_at = time.time()
+    cache.set_many({get_revocation_cache_key(user_id): revoked_at for user_id in user_ids}, timeout)
+
+
+def is_token_revoked(user_id, claims_at):
+    """
+    Проверка, были ли данные пользователя записаны в токен до отзыва его токенов
+    """
+    revoked_at = cache.get(get_revocation_cache_key(user_id))
+    return revoked_at is not None and claims_at < revoked_at
+
+
+def set_user_claims(token, user):
+    """
+    Запись в токен данных пользователя, достаточных для обработки запроса без обращения к БД
+    """
+    token["email"] = user.email
+    token["is_superuser"] = user.is_superuser
+    token["is_staff"] = user.is_staff
+    token["roles"] = sorted(get_user_roles(user))
+    token["claims_at"] = time.time()
+    return token
+
+
+class ClaimsUser(SimpleLazyObject):
+    """
+    Пользователь, построенный по данным токена: запись из БД загружается только
+    при обращении к полям, которых нет в токене
+    """
+
+    def __init__(self, token):
+        user_id = token[api_settings.USER_ID_CLAIM]
+        super().__init__(lambda: User.objects.get(pk=user_id))
+        self.__dict__.update(pk=user_id,
+                             id=user_id,
+                             email=token["email"],
+                             is_superuser=token["is_superuser"],
+                             is_staff=token["is_staff"],
+                             is_active=True,
+                             is_authenticated=True,
+                             is_anonymous=False,
+                             _cached_roles=frozenset(token["roles"]))
+
+    def __bool__(self):
+        """
+        Проверка наличия пользователя без загрузки записи из БД
+        """
+        return True
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    Аутентификация по JWT без запроса пользователя из БД с проверкой отзыва токена.
+    Без Redis пользователь загружается из БД: отзыв токенов в кеше процесса, например
+    при блокировке в worker celery, не был бы виден веб-процессам
+    """
+
+    def get_user(self, validated_token):
+        """
+        Получение пользователя по данным токена
+        """
+        if "claims_at" not in validated_token or not settings.CACHE_LOCATION:
+            return super().get_user(validated_token)
+
+        if is_token_revoked(validated_token[api_settings.USER_ID_CLAIM], validated_token["claims_at"]):
+            raise AuthenticationFailed("Токен отозван", code="token_revoked")
+        return ClaimsUser(validated_token)
@@ -0,0 +1,76 @@
+from datetime import datetime, timezone
+
+import redis
+
+from config import settings
+from users.models import User
+
+
+class RedisLastLoginBuffer:
+    """
+    Буфер времени входа пользователей в хеше Redis: для каждого пользователя хранится последнее значение
+    """
+    key = "users:last_login"
+
+    def __init__(self, location):
+        self.client = redis.Redis.from_url(location)
+
+    def push(self, user_id, timestamp):
+        """
+        Запись времени входа пользователя
+        """
+        self.client.hset(self.key, user_id, timestamp)
+
+    def peek(self):
+        """
+        Получение накопленных значений без очистки
+        """
+        data = self.client.hgetall(self.key)
+        return {int(user_id): float(timestamp) for user_id, timestamp in data.items()}
+
+    def drain(self):
+        """
+        Получение и очистка накопленных значений одной транзакцией
+        """
+        with self.client.pipeline() as pipe:
+            pipe.hgetall(self.key)
+            pipe.delete(self.key)
+            data, _ = pipe.execute()
+        return {int(user_id): float(timestamp) for user_id, timestamp in data.items()}
+
+
+class DatabaseLastLoginBuffer:
+    """
+    Запись времени входа пользователей сразу в БД, используется без Redis: буфер в памяти процесса
+    веб-сервера не был бы виден worker celery, переносящему значения в БД
+    """
+
+    def push(self, user_id, timestamp):
+        """
+        Запись времени входа пользователя
+        """
+        User.objects.filter(pk=user_id).update(last_login=datetime.fromtimestamp(timestamp, tz=timezone.utc))
+
+    def peek(self):
+        """
+        Накопленных значений нет
+        """
+        return {}
+
+    def drain(self):
+        """
+        Накопленных значений нет
+        """
+        return {}
+
+
+def get_last_login_buffer():
+    """
+    Выбор буфера в зависимости от наличия Redis
+    """
+    if settings.CACHE_LOCATION:
+        return RedisLastLoginBuffer(settings.CACHE_LOCATION)
+    return DatabaseLastLoginBuffer()
+
+
+last_login_buffer = get_last_login_buffer()
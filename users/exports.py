@@ -0,0 +1,53 @@
+import csv
+import json
+
+from config import settings
+
+PAYMENT_EXPORT_FIELDS = ["id", "payment_date", "amount", "payment_method", "status",
+                         "owner_id", "course_id", "lesson_id", "session_id"]
+
+EXPORT_CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+class Echo:
+    """
+    Псевдо-файл для csv.writer, возвращающий записанную строку вместо ее хранения
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_payment_rows(queryset):
+    """
+    Строки платежей из курсора на стороне сервера БД пачками по PAYMENT_EXPORT_CHUNK_SIZE
+    """
+    return queryset.order_by("id").values_list(*PAYMENT_EXPORT_FIELDS).iterator(
+        chunk_size=settings.PAYMENT_EXPORT_CHUNK_SIZE)
+
+
+def iter_payments_csv(queryset):
+    """
+    Выгрузка платежей в CSV построчно
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(PAYMENT_EXPORT_FIELDS)
+    for row in iter_payment_rows(queryset):
+        yield writer.writerow(row)
+
+
+def iter_payments_ndjson(queryset):
+    """
+    Выгрузка платежей в NDJSON: по одному JSON-объекту на строку
+    """
+    for row in iter_payment_rows(queryset):
+        yield json.dumps(dict(zip(PAYMENT_EXPORT_FIELDS, row)), ensure_ascii=False, default=str) + "\n"
+
+
+EXPORTERS = {
+    "csv": iter_payments_csv,
+    "ndjson": iter_payments_ndjson,
+}
@@ -0,0 +1,15 @@
+from django_filters import rest_framework as filters
+
+from mypedia.models import Payment
+
+
+class PaymentFilter(filters.FilterSet):
+    """
+    Фильтр платежей по курсу, уроку, способу оплаты и периоду оплаты
+    """
+    date_from = filters.DateFilter(field_name="payment_date", lookup_expr="gte")
+    date_to = filters.DateFilter(field_name="payment_date", lookup_expr="lte")
+
+    class Meta:
+        model = Payment
+        fields = ["course", "lesson", "payment_method", "date_from", "date_to"]
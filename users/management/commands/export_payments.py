@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from mypedia.models import Payment
+from users.exports import EXPORTERS
+from users.filters import PaymentFilter
+
+
+class Command(BaseCommand):
+    """
+    Потоковая выгрузка платежей в CSV или NDJSON
+    """
+    def handle(self, *args, **options):
+
+        params = {name: options[name] for name in ["course", "lesson", "payment_method", "date_from", "date_to"]
+                  if options[name] is not None}
+        payment_filter = PaymentFilter(params, queryset=Payment.objects.all())
+        if not payment_filter.is_valid():
+            raise CommandError(payment_filter.errors.as_text())
+
+        lines = EXPORTERS[options["format"]](payment_filter.qs)
+        if not options["output"]:
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+
+        with open(options["output"], "w", encoding="utf-8", newline="") as output:
+            output.writelines(lines)
+        self.stdout.write(self.style.SUCCESS(f"Платежи выгружены в файл {options['output']}"))
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=list(EXPORTERS), default="csv", help="формат выгрузки")
+        parser.add_argument("--output", help="файл выгрузки, по умолчанию stdout")
+        parser.add_argument("--course", type=int, help="ID курса")
+        parser.add_argument("--lesson", type=int, help="ID урока")
+        parser.add_argument("--payment-method", dest="payment_method", help="способ оплаты")
+        parser.add_argument("--date-from", dest="date_from", help="начало периода оплаты, YYYY-MM-DD")
+        parser.add_argument("--date-to", dest="date_to", help="конец периода оплаты, YYYY-MM-DD")
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("users", "0004_delete_payment"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(fields=["is_active", "last_login"], name="users_active_last_login_idx"),
+        ),
+    ]
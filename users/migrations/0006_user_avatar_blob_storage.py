@@ -0,0 +1,26 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:15
+
+from django.db import migrations, models
+
+import src.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0005_user_users_active_last_login_idx"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="user",
+            name="avatar",
+            field=models.ImageField(
+                blank=True,
+                null=True,
+                storage=src.storage.get_blob_storage,
+                upload_to="users/avatars/",
+                verbose_name="Аватар",
+            ),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+from src.storage import get_blob_storage
+
 
 # Create your models here.
 class User(AbstractUser):
@@ -18,6 +20,7 @@ class User(AbstractUser):
                                     null=True,
                                     blank=True)
     avatar = models.ImageField(upload_to="users/avatars/",
+                               storage=get_blob_storage,
                                verbose_name="Аватар",
                                null=True,
                                blank=True)
@@ -32,6 +35,7 @@ class User(AbstractUser):
     class Meta:
         verbose_name = "Пользователь"
         verbose_name_plural = "Пользователи"
+        indexes = [models.Index(fields=["is_active", "last_login"], name="users_active_last_login_idx")]
 
     def __str__(self):
         return self.email
@@ -1,12 +1,14 @@
 from rest_framework.permissions import BasePermission
 
+from .roles import is_moderator
+
 
 class IsModerator(BasePermission):
     def has_permission(self, request, view):
         """
         Проверка, является ли пользователь модератором
         """
-        return request.user.groups.filter(name="Moderators").exists()
+        return is_moderator(request.user)
 
 
 class IsOwner(BasePermission):
@@ -14,7 +16,7 @@ class IsOwner(BasePermission):
         """
         Проверка, является ли пользователь владельцем
         """
-        return obj.owner == request.user
+        return obj.owner_id == request.user.pk
 
 
 class IsCurrentUser(BasePermission):
@@ -22,4 +24,12 @@ class IsCurrentUser(BasePermission):
         """
         Проверка, является ли текущий пользователь владельцем учетной записи
         """
-        return obj == request.user
+        return obj.pk == request.user.pk
+
+
+class IsAccountOwner(BasePermission):
+    def has_permission(self, request, view):
+        """
+        Проверка, относится ли вложенный ресурс к учетной записи текущего пользователя
+        """
+        return view.kwargs.get("pk") == request.user.pk
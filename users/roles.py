@@ -0,0 +1,53 @@
+from django.core.cache import cache
+
+from config import settings
+
+MODERATORS_GROUP = "Moderators"
+
+
+def get_roles_cache_key(user_id):
+    """
+    Ключ кеша ролей пользователя
+    """
+    return f"users:roles:{user_id}"
+
+
+def get_user_roles(user):
+    """
+    Получение ролей пользователя: один раз за запрос и с кешированием между запросами в Redis,
+    кеш процесса не сбрасывался бы при изменении групп в другом процессе
+    """
+    if not user.is_authenticated:
+        return frozenset()
+
+    roles = getattr(user, "_cached_roles", None)
+    if roles is None:
+        key = get_roles_cache_key(user.pk)
+        roles = cache.get(key) if settings.CACHE_LOCATION else None
+        if roles is None:
+            roles = frozenset(user.groups.values_list("name", flat=True))
+            if settings.CACHE_LOCATION:
+                cache.set(key, roles, settings.ROLES_CACHE_TIMEOUT)
+        user._cached_roles = roles
+    return roles
+
+
+def is_moderator(user):
+    """
+    Проверка, является ли пользователь модератором
+    """
+    return MODERATORS_GROUP in get_user_roles(user)
+
+
+def is_staff_member(user):
+    """
+    Проверка, является ли пользователь администратором или модератором
+    """
+    return user.is_superuser or is_moderator(user)
+
+
+def invalidate_user_roles(*user_ids):
+    """
+    Сброс закешированных ролей пользователей
+    """
+    cache.delete_many([get_roles_cache_key(user_id) for user_id in user_ids])
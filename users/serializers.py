@@ -1,7 +1,14 @@
 from rest_framework import serializers
+from rest_framework.reverse import reverse
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
 
+from config import settings
 from mypedia.serializers import PaymentSerializer
+from src.images import get_srcset
 
+from .authentication import set_user_claims
 from .models import User
 
 
@@ -19,9 +26,17 @@ class UserSerializer(serializers.ModelSerializer):
     Сериализатор для модели User
     """
 
+    avatar_srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = User
-        fields = ["id", "email", "username", "first_name", "country", "avatar"]
+        fields = ["id", "email", "username", "first_name", "country", "avatar", "avatar_srcset"]
+
+    def get_avatar_srcset(self, obj):
+        """
+        Ссылки на уменьшенные копии аватара в формате srcset
+        """
+        return get_srcset(obj, "avatar", self.context.get("request"))
 
 
 class UserDetailSerializer(serializers.ModelSerializer):
@@ -29,9 +44,63 @@ class UserDetailSerializer(serializers.ModelSerializer):
     Сериализатор для детальной информации об объекте модели User
     """
 
-    payments_history = PaymentSerializer(source="payments", many=True)
+    avatar_srcset = serializers.SerializerMethodField()
+    payments_history = serializers.SerializerMethodField()
+    payments_url = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = ["id", "email", "password", "username", "first_name", "last_name", "phone_number",
-                  "country", "avatar", "payments_history"]
+                  "country", "avatar", "avatar_srcset", "payments_history", "payments_url"]
+
+    def get_avatar_srcset(self, obj):
+        """
+        Ссылки на уменьшенные копии аватара в формате srcset
+        """
+        return get_srcset(obj, "avatar", self.context.get("request"))
+
+    def get_payments_history(self, obj):
+        """
+        Последние платежи пользователя, количество ограничено настройкой USER_PAYMENTS_LIMIT
+        """
+        if hasattr(obj, "recent_payments"):
+            payments = obj.recent_payments
+        else:
+            payments = obj.payments.order_by("-id")[:settings.USER_PAYMENTS_LIMIT]
+        return PaymentSerializer(payments, many=True, context=self.context).data
+
+    def get_payments_url(self, obj):
+        """
+        Ссылка на постраничную историю всех платежей пользователя
+        """
+        return reverse("users:user-payments", args=[obj.pk], request=self.context.get("request"))
+
+
+class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Сериализатор получения токенов с данными пользователя в токене
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        """
+        Добавление данных пользователя в токен
+        """
+        return set_user_claims(super().get_token(user), user)
+
+
+class MyTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Сериализатор обновления access-токена с актуальными данными пользователя
+    """
+
+    def validate(self, attrs):
+        """
+        Выдача нового access-токена по refresh-токену активного пользователя
+        """
+        refresh = self.token_class(attrs["refresh"])
+        user = User.objects.filter(pk=refresh.payload.get(api_settings.USER_ID_CLAIM)).first()
+        if not user or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages["no_active_account"], "no_active_account")
+
+        return {"access": str(set_user_claims(refresh.access_token, user))}
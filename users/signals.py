@@ -0,0 +1,99 @@
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from mypedia.tasks import get_file_name, schedule_image_derivatives
+from src.utils import release_media, update_media_references
+
+from .authentication import revoke_user_tokens
+from .models import User
+from .roles import invalidate_user_roles
+
+CLAIM_FIELDS = ("email", "is_active", "is_staff", "is_superuser")
+
+
+def get_claims_snapshot(instance):
+    """
+    Значения полей пользователя, которые записываются в токен
+    """
+    return tuple(instance.__dict__.get(field) for field in CLAIM_FIELDS)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def reset_roles_on_groups_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Сброс кеша ролей и отзыв токенов при изменении состава групп пользователя
+    """
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+
+    if reverse:
+        if action == "pre_clear":
+            pk_set = instance.user_set.values_list("pk", flat=True)
+        user_ids = list(pk_set)
+    else:
+        instance.__dict__.pop("_cached_roles", None)
+        user_ids = [instance.pk]
+
+    invalidate_user_roles(*user_ids)
+    revoke_user_tokens(*user_ids)
+
+
+@receiver(pre_delete, sender=Group)
+def reset_roles_on_group_delete(sender, instance, **kwargs):
+    """
+    Сброс кеша ролей и отзыв токенов участников удаляемой группы
+    """
+    user_ids = list(instance.user_set.values_list("pk", flat=True))
+    invalidate_user_roles(*user_ids)
+    revoke_user_tokens(*user_ids)
+
+
+@receiver(post_init, sender=User)
+def remember_claims(sender, instance, **kwargs):
+    """
+    Запоминание значений полей пользователя, которые записываются в токен, и аватара
+    """
+    instance._claims_snapshot = get_claims_snapshot(instance)
+    if "avatar" in instance.__dict__:
+        instance._original_avatar = get_file_name(instance.__dict__["avatar"])
+
+
+@receiver(post_save, sender=User)
+def reset_roles_on_user_change(sender, instance, created, **kwargs):
+    """
+    Сброс кеша ролей при изменении пользователя и отзыв токенов при изменении данных в них
+    """
+    instance.__dict__.pop("_cached_roles", None)
+    invalidate_user_roles(instance.pk)
+
+    snapshot = get_claims_snapshot(instance)
+    if not created and snapshot != instance._claims_snapshot:
+        revoke_user_tokens(instance.pk)
+    instance._claims_snapshot = snapshot
+
+
+@receiver(post_save, sender=User)
+def update_avatar(sender, instance, created, **kwargs):
+    """
+    Перенос ссылки на файл и создание уменьшенных копий нового аватара пользователя
+    """
+    avatar = instance.avatar.name or None
+    original_avatar = None if created else getattr(instance, "_original_avatar", avatar)
+    if avatar != original_avatar:
+        update_media_references(original_avatar, avatar)
+        if avatar:
+            schedule_image_derivatives(instance, "avatar")
+    instance._original_avatar = avatar
+
+
+@receiver(post_delete, sender=User)
+def reset_roles_on_user_delete(sender, instance, **kwargs):
+    """
+    Сброс кеша ролей, отзыв токенов и удаление ссылки на аватар удаленного пользователя
+    """
+    invalidate_user_roles(instance.pk)
+    revoke_user_tokens(instance.pk)
+    avatar = get_file_name(instance.__dict__.get("avatar"))
+    if avatar:
+        release_media(avatar)
@@ -1,19 +1,204 @@
-from celery import shared_task
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+import stripe
+from celery import chain, shared_task
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Value, When
 from django.utils import timezone
 
+from config import settings
+from mypedia.models import Payment, StripeEvent
+from src.utils import check_session_status, create_stripe_session, get_or_create_stripe_price
+from users.authentication import revoke_user_tokens
+from users.buffers import last_login_buffer
 from users.models import User
 
 
 @shared_task()
-def block_inactive_users():
+def block_inactive_users(dry_run=False, chunk_size=None):
+    """
+    Блокирует пользователей, которые не заходили более месяца, пачками массовых UPDATE;
+    в режиме dry_run только подсчитывает их с учетом еще не перенесенного в БД времени входа.
+    Возвращает отчет с количеством и длительностью
+    """
+    started_at = time.monotonic()
+    chunk_size = chunk_size or settings.BLOCK_INACTIVE_USERS_CHUNK_SIZE
+    threshold = timezone.now() - timedelta(days=settings.INACTIVE_USER_DAYS)
+    users = User.objects.filter(is_active=True, last_login__lte=threshold)
+
+    report = {"dry_run": dry_run, "threshold": threshold.isoformat(), "inactive": 0, "blocked": 0, "chunks": []}
+
+    if dry_run:
+        recent = [user_id for user_id, timestamp in last_login_buffer.peek().items()
+                  if timestamp > threshold.timestamp()]
+        report["inactive"] = users.exclude(pk__in=recent).count()
+    else:
+        flush_last_login_buffer()
+        while True:
+            chunk_started_at = time.monotonic()
+            user_ids = list(users.order_by("pk").values_list("pk", flat=True)[:chunk_size])
+            if not user_ids:
+                break
+            blocked = User.objects.filter(pk__in=user_ids, is_active=True).update(is_active=False)
+            revoke_user_tokens(*user_ids)
+            report["blocked"] += blocked
+            report["chunks"].append({"blocked": blocked, "duration": round(time.monotonic() - chunk_started_at, 3)})
+        report["inactive"] = report["blocked"]
+
+    report["duration"] = round(time.monotonic() - started_at, 3)
+    return report
+
+
+@shared_task()
+def flush_last_login_buffer():
+    """
+    Перенос накопленного времени входа пользователей в БД массовым обновлением
+    """
+    data = last_login_buffer.drain()
+    users = [User(pk=user_id, last_login=datetime.fromtimestamp(timestamp, tz=dt_timezone.utc))
+             for user_id, timestamp in data.items()]
+    User.objects.bulk_update(users, ["last_login"], batch_size=settings.LAST_LOGIN_FLUSH_BATCH_SIZE)
+    return len(users)
+
+
+STRIPE_RETRY_ERRORS = (stripe.APIConnectionError, stripe.RateLimitError)
+
+
+def start_payment_checkout(payment_id):
     """
-    Блокирует пользователя, если он не заходил более месяца
+    Запуск цепочки задач получения цены из каталога и создания сессии на оплату в stripe
     """
-    today = timezone.now()
+    pipeline = chain(create_payment_price.s(payment_id), create_payment_session.s())
+    return pipeline.apply_async(link_error=fail_payment_checkout.si(payment_id))
+
+
+@shared_task(autoretry_for=STRIPE_RETRY_ERRORS, retry_backoff=True, max_retries=5)
+def create_payment_price(payment_id):
+    """
+    Получение цены stripe для платежа из каталога, продукт и цена создаются только при отсутствии
+    """
+    payment = Payment.objects.select_related("course", "lesson").get(pk=payment_id)
+    return {"payment_id": payment_id, "price_id": get_or_create_stripe_price(payment)}
+
+
+@shared_task(autoretry_for=STRIPE_RETRY_ERRORS, retry_backoff=True, max_retries=5)
+def create_payment_session(checkout):
+    """
+    Создание сессии на оплату в stripe и сохранение ссылки на оплату
+    """
+    session_id, payment_link = create_stripe_session(checkout["price_id"],
+                                                     idempotency_key=f"checkout-session:{checkout['payment_id']}")
+    Payment.objects.filter(pk=checkout["payment_id"]).update(session_id=session_id, link=payment_link, status="unpaid")
+    return {**checkout, "session_id": session_id}
+
+
+@shared_task()
+def fail_payment_checkout(payment_id):
+    """
+    Отметка платежа, для которого не удалось создать сессию на оплату
+    """
+    Payment.objects.filter(pk=payment_id, status="pending").update(status="failed")
+
+
+def fetch_session_status(session_id):
+    """
+    Уточнение статуса сессии в stripe, None при ошибке запроса
+    """
+    try:
+        return check_session_status(session_id)
+    except stripe.StripeError:
+        return None
+
+
+@shared_task()
+def reconcile_payment_statuses(batch_size=None):
+    """
+    Сверка статусов неоплаченных платежей с сессиями stripe: сессии проверяются параллельно
+    пачками, изменившиеся статусы записываются массовым обновлением
+    """
+    started_at = time.monotonic()
+    batch_size = batch_size or settings.PAYMENT_RECONCILE_BATCH_SIZE
+    since = timezone.now().date() - timedelta(days=settings.PAYMENT_RECONCILE_DAYS)
+    payments = Payment.objects.filter(status="unpaid", session_id__isnull=False, payment_date__gte=since)
+
+    report = {"checked": 0, "updated": 0, "errors": 0}
+    last_id = 0
+    with ThreadPoolExecutor(max_workers=settings.PAYMENT_RECONCILE_CONCURRENCY) as executor:
+        while True:
+            batch = payments.filter(pk__gt=last_id).order_by("pk").only("pk", "session_id", "status")
+            batch = list(batch[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].pk
+
+            changed = []
+            statuses = executor.map(fetch_session_status, [payment.session_id for payment in batch])
+            for payment, payment_status in zip(batch, statuses):
+                if payment_status is None:
+                    report["errors"] += 1
+                elif payment_status != payment.status:
+                    payment.status = payment_status
+                    changed.append(payment)
+
+            Payment.objects.bulk_update(changed, ["status"])
+            report["checked"] += len(batch)
+            report["updated"] += len(changed)
+
+    report["duration"] = round(time.monotonic() - started_at, 3)
+    return report
+
+
+STRIPE_SESSION_EVENT_STATUSES = {
+    "checkout.session.async_payment_succeeded": "paid",
+    "checkout.session.async_payment_failed": "failed",
+    "checkout.session.expired": "expired",
+}
+
+
+def schedule_stripe_events_processing():
+    """
+    Планирование обработки входящих событий stripe: события, пришедшие в течение
+    STRIPE_EVENTS_PROCESS_DELAY, обрабатываются одной задачей
+    """
+    delay = settings.STRIPE_EVENTS_PROCESS_DELAY
+    if cache.add("users:stripe_events", True, timeout=delay):
+        process_stripe_events.apply_async(countdown=delay)
+
+
+def get_session_status(event):
+    """
+    Статус оплаты сессии по событию stripe
+    """
+    if event.type == "checkout.session.completed":
+        return event.payload["data"]["object"].get("payment_status")
+    return STRIPE_SESSION_EVENT_STATUSES.get(event.type)
+
+
+@shared_task()
+def process_stripe_events():
+    """
+    Обработка входящих событий stripe пачками с массовым обновлением статусов платежей
+    """
+    processed = 0
+    while True:
+        with transaction.atomic():
+            events = StripeEvent.objects.select_for_update(skip_locked=True).filter(processed_at__isnull=True)
+            events = list(events.order_by("id")[:settings.STRIPE_EVENTS_BATCH_SIZE])
+            if not events:
+                return processed
+
+            statuses = {}
+            for event in events:
+                session_status = get_session_status(event)
+                if session_status:
+                    statuses[event.payload["data"]["object"]["id"]] = session_status
 
-    users = User.objects.filter(is_active=True)
-    for user in users:
-        if user.last_login and (today - user.last_login).days >= 30:
-            user.is_active = False
-            user.save()
-            print(f"{user} - заблокирован")
+            if statuses:
+                Payment.objects.filter(session_id__in=statuses).update(status=Case(
+                    *[When(session_id=session_id, then=Value(status)) for session_id, status in statuses.items()]))
+            StripeEvent.objects.filter(pk__in=[event.pk for event in events]).update(processed_at=timezone.now())
+            processed += len(events)
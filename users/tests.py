@@ -1,11 +1,182 @@
+import hashlib
+import hmac
+import json
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from itertools import count
+from types import SimpleNamespace
+from unittest import skipUnless
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
+from celery.exceptions import SoftTimeLimitExceeded
 from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
 
-from mypedia.models import Course, Lesson, Payment
+from config import celery_app, settings
+from mypedia.models import Course, Lesson, Payment, StripeEvent, StripePrice
+from src.stripe_gateway import CircuitBreaker, CircuitOpenError, StripeGateway, gateway
+from src.utils import get_queryset_for_owner
 
 from .models import User
+from .roles import is_moderator
+from .tasks import block_inactive_users, flush_last_login_buffer, process_stripe_events, reconcile_payment_statuses
+from .views import PaymentListCreateAPIView
+
+
+class LocalLastLoginBuffer:
+    """
+    Буфер времени входа пользователей в памяти процесса: вход и перенос в БД выполняются
+    в одном процессе теста
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = {}
+
+    def push(self, user_id, timestamp):
+        """
+        Запись времени входа пользователя
+        """
+        with self.lock:
+            self.data[user_id] = timestamp
+
+    def peek(self):
+        """
+        Получение накопленных значений без очистки
+        """
+        with self.lock:
+            return dict(self.data)
+
+    def drain(self):
+        """
+        Получение и очистка накопленных значений
+        """
+        with self.lock:
+            data, self.data = self.data, {}
+        return data
+
+
+class FakeStripeServer:
+    """
+    Локальный HTTP-сервер, имитирующий API stripe для тестов: на время работы
+    в контексте запросы клиента stripe направляются на него
+    """
+
+    def __init__(self, stripe_gateway=None):
+        self.gateway = stripe_gateway or gateway
+        self.requests = []
+        self.sessions = {}
+        self.failures = []
+        self.idempotent_responses = {}
+        self.ids = count(1)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.get_handler_class())
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.previous = self.gateway.api_base, self.gateway.api_key
+        self.gateway.api_base, self.gateway.api_key = self.url, "sk_test_fake"
+        return self
+
+    def __exit__(self, *args):
+        self.gateway.api_base, self.gateway.api_key = self.previous
+        self.server.shutdown()
+        self.server.server_close()
+
+    def set_session_status(self, session_id, payment_status):
+        """
+        Изменение статуса оплаты сессии
+        """
+        self.sessions[session_id]["payment_status"] = payment_status
+
+    def fail_next(self, *codes):
+        """
+        Ответ на следующие запросы ошибками с заданными кодами
+        """
+        self.failures.extend(codes)
+
+    def handle(self, method, path, params, idempotency_key=None):
+        """
+        Обработка запроса к API, возвращает код ответа и тело ответа,
+        повторный запрос с тем же ключом идемпотентности получает сохраненный ответ
+        """
+        self.requests.append((method, path))
+        if self.failures:
+            return self.failures.pop(0), {"error": {"type": "api_error", "message": "Fake failure"}}
+        if idempotency_key in self.idempotent_responses:
+            return self.idempotent_responses[idempotency_key]
+
+        response = self.route(method, path, params)
+        if idempotency_key and response[0] == 200:
+            self.idempotent_responses[idempotency_key] = response
+        return response
+
+    def route(self, method, path, params):
+        """
+        Ответ API на запрос
+        """
+        number = next(self.ids)
+
+        if method == "POST" and path == "/v1/products":
+            return 200, {"id": f"prod_{number}", "object": "product", "name": params.get("name")}
+        if method == "POST" and path == "/v1/prices":
+            return 200, {"id": f"price_{number}", "object": "price", "product": params.get("product"),
+                         "currency": params.get("currency"), "unit_amount": int(params.get("unit_amount", 0))}
+        if method == "POST" and path == "/v1/checkout/sessions":
+            session_id = f"cs_test_{number}"
+            self.sessions[session_id] = {"id": session_id, "object": "checkout.session", "payment_status": "unpaid",
+                                         "url": f"https://checkout.stripe.com/c/pay/{session_id}"}
+            return 200, self.sessions[session_id]
+        if method == "GET" and path.startswith("/v1/checkout/sessions/"):
+            session = self.sessions.get(path.rsplit("/", 1)[-1])
+            if session:
+                return 200, session
+        return 404, {"error": {"type": "invalid_request_error", "message": "No such resource"}}
+
+    def get_handler_class(self):
+        """
+        Класс обработчика HTTP-запросов, передающий их серверу
+        """
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def respond(self, method):
+                url = urlparse(self.path)
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode()
+                params = {key: values[-1] for key, values in parse_qs(body or url.query).items()}
+                code, data = fake.handle(method, url.path, params, self.headers.get("Idempotency-Key"))
+
+                content = json.dumps(data).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_GET(self):
+                self.respond("GET")
+
+            def do_POST(self):
+                self.respond("POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
 
 
 # Create your tests here.
@@ -48,7 +219,9 @@ class UserTestCase(APITestCase):
                        'phone_number',
                        'country',
                        'avatar',
-                       'payments_history']
+                       'avatar_srcset',
+                       'payments_history',
+                       'payments_url']
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(data_keys, result_keys)
@@ -63,7 +236,8 @@ class UserTestCase(APITestCase):
                        'username',
                        'first_name',
                        'country',
-                       'avatar']
+                       'avatar',
+                       'avatar_srcset']
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(data_keys, result_keys)
@@ -83,11 +257,44 @@ class UserTestCase(APITestCase):
                        'phone_number',
                        'country',
                        'avatar',
-                       'payments_history']
+                       'avatar_srcset',
+                       'payments_history',
+                       'payments_url']
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(data_keys, result_keys)
 
+    def test_user_payments_history(self):
+        """
+        Тест ограниченной истории платежей в профиле и постраничной истории всех платежей
+        """
+
+        Payment.objects.bulk_create([Payment(amount=100, payment_method="cash", owner=self.user)
+                                     for _ in range(settings.USER_PAYMENTS_LIMIT + 5)])
+        url = reverse("users:user", args=[self.user.pk])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        history = response.json()["payments_history"]
+
+        self.assertEqual(len(history), settings.USER_PAYMENTS_LIMIT)
+        self.assertEqual(history[0]["id"], Payment.objects.latest("id").pk)
+        self.assertEqual(len([query for query in queries if 'FROM "mypedia_payment"' in query["sql"]]), 1)
+
+        # Постраничная история платежей по курсору
+        url = reverse("users:user-payments", args=[self.user.pk])
+        response = self.client.get(url, {"page_size": 10})
+        data = response.json()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(data["results"]), 10)
+
+        response = self.client.get(data["next"])
+        self.assertEqual(len(response.json()["results"]), 5)
+        self.assertIsNone(response.json()["next"])
+
+        # Чужая история платежей
+        response = self.client.get(reverse("users:user-payments", args=[self.admin.pk]))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
     def test_user_create(self):
         """
         Тест создания объекта User и автоматической активации учетной записи
@@ -200,19 +407,22 @@ class UserTestCase(APITestCase):
                    'username': self.user.username,
                    'first_name': self.user.first_name,
                    'country': self.user.country,
-                   'avatar': None},
+                   'avatar': None,
+                   'avatar_srcset': None},
                   {'id': self.admin.pk,
                    'email': self.admin.email,
                    'username': self.admin.username,
                    'first_name': self.admin.first_name,
                    'country': self.admin.country,
-                   'avatar': None},
+                   'avatar': None,
+                   'avatar_srcset': None},
                   {'id': self.moderator.pk,
                    'email': self.moderator.email,
                    'username': self.moderator.username,
                    'first_name': self.moderator.first_name,
                    'country': self.moderator.country,
-                   'avatar': None}]
+                   'avatar': None,
+                   'avatar_srcset': None}]
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(data, result)
@@ -245,6 +455,73 @@ class UserTestCase(APITestCase):
 
         self.assertTrue(result.get("access"))
 
+    def test_login_last_login(self):
+        """
+        Тест записи времени входа пользователя сразу в БД без Redis
+        """
+        self.client.logout()
+
+        url = reverse("users:login")
+        response = self.client.post(url, {"email": "test@email.com", "password": "12345"})
+        self.user.refresh_from_db()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNotNone(self.user.last_login)
+        self.assertEqual(flush_last_login_buffer(), 0)
+
+    def test_login_last_login_buffer(self):
+        """
+        Тест отложенной записи времени входа пользователя
+        """
+        self.client.logout()
+        buffer = LocalLastLoginBuffer()
+
+        url = reverse("users:login")
+        with patch("users.views.last_login_buffer", buffer), patch("users.tasks.last_login_buffer", buffer):
+            response = self.client.post(url, {"email": "test@email.com", "password": "12345"})
+            self.user.refresh_from_db()
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIsNone(self.user.last_login)
+
+            with self.assertNumQueries(1):
+                self.assertEqual(flush_last_login_buffer(), 1)
+            self.user.refresh_from_db()
+
+            self.assertIsNotNone(self.user.last_login)
+            self.assertEqual(flush_last_login_buffer(), 0)
+
+    def test_block_inactive_users(self):
+        """
+        Тест блокировки пользователей, не заходивших более месяца
+        """
+
+        long_ago = timezone.now() - timedelta(days=31)
+        inactive_user = User.objects.create(email="inactive@email.com", last_login=long_ago)
+        User.objects.filter(pk__in=[self.user.pk, self.moderator.pk]).update(last_login=long_ago)
+        User.objects.filter(pk=self.admin.pk).update(last_login=timezone.now())
+
+        # Время входа пользователя еще не перенесено из буфера в БД
+        buffer = LocalLastLoginBuffer()
+        buffer.push(self.moderator.pk, time.time())
+
+        with patch("users.tasks.last_login_buffer", buffer):
+            # Пробный запуск без изменений учитывает буфер, но не очищает его
+            report = block_inactive_users(dry_run=True)
+
+            self.assertEqual(report["inactive"], 2)
+            self.assertEqual(report["blocked"], 0)
+            self.assertEqual(User.objects.filter(is_active=False).count(), 0)
+            self.assertEqual(list(buffer.peek()), [self.moderator.pk])
+
+            # Блокировка пачками после переноса буфера
+            report = block_inactive_users(chunk_size=1)
+
+        self.assertEqual(report["blocked"], 2)
+        self.assertEqual(len(report["chunks"]), 2)
+        self.assertEqual(set(User.objects.filter(is_active=False).values_list("pk", flat=True)),
+                         {self.user.pk, inactive_user.pk})
+
 
 class PaymentTestCase(APITestCase):
     """
@@ -319,8 +596,10 @@ class PaymentTestCase(APITestCase):
 
     def test_payment_create(self):
         """
-        Тест создания объекта Payment, автоматического заполнения поля owner и создания платежа в stripe
+        Тест создания объекта Payment, автоматического заполнения поля owner и создания платежа в stripe в фоне
         """
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", False)
 
         url = reverse("users:payments")
         data = {
@@ -328,12 +607,241 @@ class PaymentTestCase(APITestCase):
             "payment_method": "cash",
             "lesson": self.lesson.pk
         }
-        response = self.client.post(url, data)
+        with FakeStripeServer() as stripe_server:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(url, data)
 
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(response.json()["owner"], self.user.pk)
-        self.assertTrue(all([response.json().get("link"), response.json().get("session_id")]))
+        self.assertEqual(response.json()["status"], "pending")
+        self.assertEqual(Payment.objects.all().count(), 3)
+        self.assertEqual([path for method, path in stripe_server.requests],
+                         ["/v1/products", "/v1/prices", "/v1/checkout/sessions"])
+
+        # Статус платежа после создания сессии на оплату
+        url = reverse("users:payment-status", args=[response.json()["id"]])
+        response = self.client.get(url, {"wait": 1})
+        data = response.json()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(data["status"], "unpaid")
+        self.assertTrue(all([data.get("link"), data.get("session_id")]))
+
+    def test_payment_create_reuses_stripe_price(self):
+        """
+        Тест повторного использования продукта и цены stripe из каталога и их сброса при переименовании урока
+        """
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", False)
+        cache.clear()
+
+        url = reverse("users:payments")
+        data = {
+            "amount": 10000,
+            "payment_method": "cash",
+            "lesson": self.lesson.pk
+        }
+        with FakeStripeServer() as stripe_server:
+            for _ in range(2):
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.client.post(url, data)
+            paths = [path for method, path in stripe_server.requests]
+            self.assertEqual(paths, ["/v1/products", "/v1/prices", "/v1/checkout/sessions", "/v1/checkout/sessions"])
+            self.assertEqual(StripePrice.objects.filter(lesson=self.lesson).count(), 1)
+
+            # Без кеша цена берется из каталога в БД
+            cache.clear()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(url, data)
+            self.assertEqual(len(stripe_server.requests), 5)
+
+            # Переименование урока требует нового продукта в stripe
+            self.lesson.name = "Новое название урока"
+            self.lesson.save()
+            self.assertFalse(StripePrice.objects.filter(lesson=self.lesson).exists())
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(url, data)
+            self.assertEqual([path for method, path in stripe_server.requests][5:],
+                             ["/v1/products", "/v1/prices", "/v1/checkout/sessions"])
+
+    def test_payment_create_idempotency_key(self):
+        """
+        Тест повтора создания объекта Payment с заголовком Idempotency-Key
+        """
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", False)
+        cache.clear()
+
+        url = reverse("users:payments")
+        data = {"amount": 10000, "payment_method": "cash", "lesson": self.lesson.pk}
+        headers = {"Idempotency-Key": "payment-1"}
+        with FakeStripeServer() as stripe_server:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(url, data, headers=headers)
+            with self.captureOnCommitCallbacks(execute=True):
+                repeated = self.client.post(url, data, headers=headers)
+
+        self.assertEqual(repeated.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(repeated.json(), response.json())
+        self.assertEqual(repeated.headers["Idempotent-Replayed"], "true")
         self.assertEqual(Payment.objects.all().count(), 3)
+        self.assertEqual([path for method, path in stripe_server.requests].count("/v1/checkout/sessions"), 1)
+
+        # Тот же ключ с другими данными
+        response = self.client.post(url, {**data, "amount": 500}, headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        # Одновременный повтор, пока первый запрос еще выполняется
+        request = SimpleNamespace(user=self.user, path=url)
+        cache.set(f"{PaymentListCreateAPIView().get_idempotency_cache_key(request, 'payment-2')}:lock", True)
+        with patch.object(settings, "IDEMPOTENCY_WAIT", 0):
+            response = self.client.post(url, data, headers={"Idempotency-Key": "payment-2"})
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Payment.objects.all().count(), 3)
+
+    def test_payment_export(self):
+        """
+        Тест потоковой выгрузки платежей администратором в CSV и NDJSON с фильтрами
+        """
+
+        url = reverse("users:payments-export")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(User.objects.create(email="admin@email.com", is_staff=True))
+        response = self.client.get(url, {"payment_method": "cash"})
+        rows = b"".join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual(rows[0].split(",")[:3], ["id", "payment_date", "amount"])
+        self.assertEqual([row.split(",")[0] for row in rows[1:]], [str(self.payment.pk)])
+
+        response = self.client.get(url, {"file_format": "ndjson", "lesson": self.lesson.pk,
+                                         "date_from": self.payment_2.payment_date.isoformat()})
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([(row["id"], row["lesson_id"]) for row in rows], [(self.payment_2.pk, self.lesson.pk)])
+
+        response = self.client.get(url, {"file_format": "xml"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Выгрузка командой
+        out = StringIO()
+        call_command("export_payments", "--format", "ndjson", "--course", str(self.course.pk), stdout=out)
+        self.assertEqual([json.loads(line)["id"] for line in out.getvalue().splitlines()], [self.payment.pk])
+
+    def test_stripe_metrics(self):
+        """
+        Тест просмотра метрик вызовов API stripe администратором
+        """
+
+        url = reverse("users:payments-stripe-metrics")
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(User.objects.create(email="admin@email.com", is_staff=True,
+                                                           is_superuser=True))
+        gateway.metrics.reset()
+        self.addCleanup(gateway.metrics.reset)
+        gateway.metrics.record_call("prices.create", 0.2)
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["breaker"], "closed")
+        self.assertEqual(response.json()["operations"]["prices.create"]["calls"], 1)
+
+    def test_payment_status_wait(self):
+        """
+        Тест ожидания завершения создания сессии на оплату
+        """
+
+        Payment.objects.filter(pk=self.payment.pk).update(status="pending")
+        url = reverse("users:payment-status", args=[self.payment.pk])
+
+        with patch("users.views.time.sleep") as sleep:
+            response = self.client.get(url, {"wait": 0.01})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["status"], "pending")
+        self.assertEqual(response["Retry-After"], str(settings.PAYMENT_STATUS_POLL_INTERVAL))
+        self.assertTrue(sleep.called)
+
+        # Чужой платеж
+        url = reverse("users:payment-status", args=[self.payment_2.pk])
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_reconcile_payment_statuses(self):
+        """
+        Тест фоновой сверки статусов платежей с сессиями stripe
+        """
+
+        with FakeStripeServer() as stripe_server:
+            stripe_server.sessions = {"cs_paid": {"id": "cs_paid", "payment_status": "paid"},
+                                      "cs_unpaid": {"id": "cs_unpaid", "payment_status": "unpaid"}}
+            Payment.objects.filter(pk=self.payment.pk).update(session_id="cs_paid")
+            Payment.objects.filter(pk=self.payment_2.pk).update(session_id="cs_unpaid")
+            lost_payment = Payment.objects.create(amount=100, payment_method="cash", session_id="cs_lost")
+
+            # Просмотр платежа не обращается к stripe
+            response = self.client.get(reverse("users:payment", args=[self.payment.pk]))
+
+            self.assertEqual(response.json()["status"], "unpaid")
+            self.assertFalse(stripe_server.requests)
+
+            with self.assertNumQueries(4):  # три выборки пачек и одно массовое обновление
+                report = reconcile_payment_statuses(batch_size=2)
+
+        self.assertEqual(report["checked"], 3)
+        self.assertEqual(report["updated"], 1)
+        self.assertEqual(report["errors"], 1)
+        self.assertEqual(len(stripe_server.requests), 3)
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).status, "paid")
+        self.assertEqual(Payment.objects.get(pk=self.payment_2.pk).status, "unpaid")
+        self.assertEqual(Payment.objects.get(pk=lost_payment.pk).status, "unpaid")
+
+    @patch.object(settings, "STRIPE_WEBHOOK_SECRET", "whsec_test")
+    def test_stripe_webhook(self):
+        """
+        Тест приема событий stripe без повторов и их фоновой обработки
+        """
+        cache.clear()
+        Payment.objects.filter(pk=self.payment.pk).update(session_id="cs_paid")
+        self.client.logout()
+
+        url = reverse("users:payments-webhook")
+        payload = json.dumps({"id": "evt_1",
+                              "object": "event",
+                              "type": "checkout.session.completed",
+                              "data": {"object": {"id": "cs_paid", "object": "checkout.session",
+                                                  "payment_status": "paid"}}})
+        timestamp = int(time.time())
+        signature = hmac.new(b"whsec_test", f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+
+        # Повторная доставка события не создает дубликат
+        with patch.object(process_stripe_events, "apply_async") as processing:
+            for _ in range(2):
+                response = self.client.post(url, payload, content_type="application/json",
+                                            headers={"Stripe-Signature": f"t={timestamp},v1={signature}"})
+
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(StripeEvent.objects.count(), 1)
+        processing.assert_called_once()
+
+        # Некорректная подпись
+        response = self.client.post(url, payload, content_type="application/json",
+                                    headers={"Stripe-Signature": f"t={timestamp},v1=invalid"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Обработка событий
+        self.assertEqual(process_stripe_events(), 1)
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).status, "paid")
+        self.assertFalse(StripeEvent.objects.filter(processed_at__isnull=True).exists())
 
     def test_payment_update(self):
         """
@@ -431,3 +939,264 @@ class PaymentTestCase(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(data, result)
+
+    def test_payment_list_cursor(self):
+        """
+        Тест курсорного постраничного вывода списка объектов Payment
+        """
+
+        self.client.force_authenticate(self.moderator)
+        url = reverse("users:payments")
+        response = self.client.get(url, {"pagination": "cursor", "page_size": 1})
+        data = response.json()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([payment["id"] for payment in data["results"]], [self.payment.pk])
+        self.assertIsNone(data["previous"])
+
+        response = self.client.get(data["next"])
+        data = response.json()
+
+        self.assertEqual([payment["id"] for payment in data["results"]], [self.payment_2.pk])
+        self.assertIsNone(data["next"])
+
+
+@skipUnless(connection.vendor == "postgresql", "Планы запросов проверяются на PostgreSQL")
+class PaymentIndexTestCase(TestCase):
+    """
+    Тестирование использования индексов в запросах списка платежей
+    """
+
+    def setUp(self):
+        """
+        Подготовка исходных данных, последовательное чтение таблицы запрещено:
+        на маленькой таблице планировщик выбрал бы его вместо индекса
+        """
+
+        self.user = User.objects.create(email="test@email.com")
+        Payment.objects.bulk_create([Payment(amount=100, payment_method="cash", owner=self.user, status="unpaid")
+                                     for _ in range(10)])
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE mypedia_payment")
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def assertUsesIndex(self, queryset, index_name):
+        self.assertIn(index_name, queryset.explain())
+
+    def test_owner_indexes(self):
+        """
+        Тест списка платежей пользователя в порядке ID и по дате платежа
+        """
+
+        payments = get_queryset_for_owner(self.user, Payment.objects.all())
+        self.assertUsesIndex(payments, "mypedia_payment_owner_id_idx")
+        self.assertUsesIndex(payments.order_by("-payment_date"), "mypedia_payment_owner_date_idx")
+
+    def test_status_index(self):
+        """
+        Тест выборки неоплаченных платежей пакетами при сверке статусов
+        """
+
+        payments = Payment.objects.filter(status="unpaid", pk__gt=0).order_by("pk")[:100]
+        self.assertUsesIndex(payments, "mypedia_payment_status_id_idx")
+
+
+class RolesTestCase(APITestCase):
+    """
+    Тестирование кеширования ролей пользователей
+    """
+
+    def setUp(self):
+        """
+        Подготовка исходных данных
+        """
+
+        cache.clear()
+        self.group = Group.objects.create(name="Moderators")
+        self.moderator = User.objects.create(email="moderator@email.com")
+        self.moderator.groups.add(self.group)
+        self.course = Course.objects.create(name="Тестовый курс 1", owner=self.moderator)
+
+    @patch.object(settings, "CACHE_LOCATION", "redis://localhost:6379/1")
+    def test_roles_cache(self):
+        """
+        Тест однократного вычисления ролей и сброса кеша при изменении групп
+        """
+
+        # Роли вычисляются один раз за запрос
+        user = User.objects.get(pk=self.moderator.pk)
+        with self.assertNumQueries(1):
+            self.assertTrue(is_moderator(user))
+            self.assertTrue(is_moderator(user))
+
+        # Роли берутся из кеша в следующем запросе
+        user = User.objects.get(pk=self.moderator.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(is_moderator(user))
+
+        # Удаление пользователя из группы сбрасывает кеш
+        self.group.user_set.remove(self.moderator)
+        user = User.objects.get(pk=self.moderator.pk)
+        self.assertFalse(is_moderator(user))
+
+        # Добавление пользователя в группу сбрасывает кеш
+        user.groups.add(self.group)
+        self.assertTrue(is_moderator(user))
+
+    def test_course_list_group_queries(self):
+        """
+        Тест количества обращений к группам при запросе списка курсов модератором
+        """
+
+        self.client.force_authenticate(User.objects.get(pk=self.moderator.pk))
+        url = reverse("mypedia:courses-list")
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLessEqual(len([query for query in queries if "auth_group" in query["sql"]]), 1)
+
+    @patch.object(settings, "CACHE_LOCATION", "redis://localhost:6379/1")
+    def test_stateless_token_user(self):
+        """
+        Тест аутентификации по данным токена без запроса пользователя и отзыва токена при изменении ролей
+        """
+
+        self.moderator.set_password("12345")
+        self.moderator.save()
+        tokens = self.client.post(reverse("users:login"), {"email": "moderator@email.com", "password": "12345"}).json()
+        url = reverse("mypedia:courses-list")
+
+        # Пользователь и роли берутся из токена
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, headers={"Authorization": f"Bearer {tokens['access']}"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("lessons_url", response.json()["results"][0])
+        self.assertFalse([query for query in queries if "users_user" in query["sql"] or "auth_group" in query["sql"]])
+
+        # Изменение ролей отзывает выданный токен
+        self.group.user_set.remove(self.moderator)
+        response = self.client.get(url, headers={"Authorization": f"Bearer {tokens['access']}"})
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # Обновленный токен содержит актуальные роли
+        access = self.client.post(reverse("users:token-refresh"), {"refresh": tokens["refresh"]}).json()["access"]
+        response = self.client.get(url, headers={"Authorization": f"Bearer {access}"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("lessons_url", response.json()["results"][0])
+
+    def test_token_user_without_shared_cache(self):
+        """
+        Тест загрузки пользователя и ролей из БД без Redis: изменения в другом процессе видны сразу
+        """
+
+        self.moderator.set_password("12345")
+        self.moderator.save()
+        access = self.client.post(reverse("users:login"),
+                                  {"email": "moderator@email.com", "password": "12345"}).json()["access"]
+        url = reverse("mypedia:courses-list")
+        headers = {"Authorization": f"Bearer {access}"}
+
+        self.assertIn("lessons_url", self.client.get(url, headers=headers).json()["results"][0])
+
+        # Изменения без отзыва токена, как при обработке в другом процессе
+        with patch("users.signals.revoke_user_tokens"), patch("users.signals.invalidate_user_roles"):
+            self.group.user_set.remove(self.moderator)
+            response = self.client.get(url, headers=headers)
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn("lessons_url", response.json()["results"][0])
+
+            User.objects.filter(pk=self.moderator.pk).update(is_active=False)
+            response = self.client.get(url, headers=headers)
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class StripeGatewayTestCase(SimpleTestCase):
+    """
+    Тестирование клиента API stripe
+    """
+
+    def setUp(self):
+        """
+        Подготовка исходных данных
+        """
+
+        self.gateway = StripeGateway(retry_backoff=0.001, max_retries=2, breaker=CircuitBreaker(2, 0.2))
+
+    def test_retry_with_idempotency_key(self):
+        """
+        Тест повтора запроса после ошибки stripe с тем же ключом идемпотентности
+        """
+
+        with FakeStripeServer(self.gateway) as stripe_server:
+            stripe_server.fail_next(500)
+            product = self.gateway.call("products.create", params={"name": "Курс"}, idempotency_key="product:1")
+            repeated = self.gateway.call("products.create", params={"name": "Курс"}, idempotency_key="product:1")
+
+        self.assertEqual(product.get("id"), repeated.get("id"))
+        self.assertEqual(len(stripe_server.requests), 3)
+        metrics = self.gateway.metrics.snapshot()["products.create"]
+        self.assertEqual((metrics["calls"], metrics["errors"], metrics["retries"]), (3, 1, 1))
+        self.assertEqual(metrics["error_types"], {"APIError": 1})
+
+    def test_circuit_breaker(self):
+        """
+        Тест отклонения запросов без обращения к stripe после серии ошибок и восстановления после паузы
+        """
+
+        with FakeStripeServer(self.gateway) as stripe_server:
+            stripe_server.fail_next(503, 503)
+            with self.assertRaises(CircuitOpenError):
+                self.gateway.call("products.create", params={"name": "Курс"})
+            with self.assertRaises(CircuitOpenError):
+                self.gateway.call("checkout.sessions.retrieve", "cs_test_1")
+
+            self.assertEqual(len(stripe_server.requests), 2)
+            self.assertEqual(self.gateway.breaker.state, "open")
+            self.assertEqual(self.gateway.metrics.snapshot()["checkout.sessions.retrieve"]["rejected"], 1)
+
+            # После паузы пробный запрос проходит и замыкает цепь
+            time.sleep(0.25)
+            product = self.gateway.call("products.create", params={"name": "Курс"})
+
+        self.assertTrue(product.get("id"))
+        self.assertEqual(self.gateway.breaker.state, "closed")
+
+    def test_circuit_breaker_unexpected_error(self):
+        """
+        Тест размыкания цепи при ошибке, не относящейся к stripe, во время пробного запроса
+        """
+
+        breaker = self.gateway.breaker
+
+        with FakeStripeServer(self.gateway):
+            # Ошибки приложения при замкнутой цепи не считаются недоступностью stripe
+            for _ in range(breaker.failure_threshold):
+                with self.assertRaises(AttributeError):
+                    self.gateway.call("products.missing")
+            self.assertEqual(breaker.state, "closed")
+
+            breaker.record_failure()
+            breaker.record_failure()
+            time.sleep(0.25)
+            with self.assertRaises(AttributeError):
+                self.gateway.call("products.missing")
+            self.assertEqual(breaker.state, "open")
+
+            time.sleep(0.25)
+            with patch.object(self.gateway, "get_client", side_effect=SoftTimeLimitExceeded()):
+                with self.assertRaises(SoftTimeLimitExceeded):
+                    self.gateway.call("products.create", params={"name": "Курс"})
+            self.assertEqual(breaker.state, "open")
+
+            # Следующий пробный запрос после паузы проходит и замыкает цепь
+            time.sleep(0.25)
+            self.gateway.call("products.create", params={"name": "Курс"})
+
+        self.assertEqual(breaker.state, "closed")
@@ -10,10 +10,15 @@ app_name = UsersConfig.name
 urlpatterns = [
     path("users/", views.UserListCreateAPIView.as_view(), name="users"),
     path("users/<int:pk>/", views.UserRetrieveUpdateDestroyAPIView.as_view(), name="user"),
+    path("users/<int:pk>/payments/", views.UserPaymentListAPIView.as_view(), name="user-payments"),
 
     path('login/', views.MyToken.as_view(), name='login'),
     path('token/refresh/', TokenRefreshView.as_view(permission_classes=[AllowAny]), name='token-refresh'),
 
     path("payments/", views.PaymentListCreateAPIView.as_view(), name="payments"),
+    path("payments/export/", views.PaymentExportAPIView.as_view(), name="payments-export"),
+    path("payments/webhook/", views.StripeWebhookAPIView.as_view(), name="payments-webhook"),
+    path("payments/stripe-metrics/", views.StripeMetricsAPIView.as_view(), name="payments-stripe-metrics"),
     path("payments/<int:pk>/", views.PaymentRetrieveUpdateDestroyAPIView.as_view(), name="payment"),
+    path("payments/<int:pk>/status/", views.PaymentStatusAPIView.as_view(), name="payment-status"),
 ]
@@ -1,19 +1,36 @@
-from django.utils import timezone
+import time
+
+import stripe
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import generics
+from rest_framework import generics, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.filters import OrderingFilter
 from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework_simplejwt.views import TokenObtainPairView
 
-from mypedia.models import Payment
-from mypedia.serializers import PaymentSerializer
-from src.utils import check_session_status, create_stripe_price, create_stripe_session, get_queryset_for_owner
+from config import settings
+from mypedia.mixins import IdempotentCreateMixin
+from mypedia.models import Payment, StripeEvent
+from mypedia.paginators import CursorPaginator, PaymentHistoryPaginator
+from mypedia.serializers import PaymentSerializer, PaymentStatusSerializer
+from src.images import annotate_derivative_widths
+from src.stripe_gateway import gateway
+from src.utils import get_queryset_for_owner
 
+from .buffers import last_login_buffer
+from .exports import EXPORT_CONTENT_TYPES, EXPORTERS
+from .filters import PaymentFilter
 from .models import User
-from .permissions import IsCurrentUser, IsModerator, IsOwner
+from .permissions import IsAccountOwner, IsCurrentUser, IsModerator, IsOwner
 from .serializers import NewUserSerializer, UserDetailSerializer, UserSerializer
+from .tasks import schedule_stripe_events_processing, start_payment_checkout
 
 
 # Create your views here.
@@ -40,6 +57,12 @@ class UserListCreateAPIView(generics.ListCreateAPIView):
             return NewUserSerializer
         return UserSerializer
 
+    def get_queryset(self):
+        """
+        Загрузка ширин уменьшенных копий аватаров вместе со списком
+        """
+        return annotate_derivative_widths(super().get_queryset(), "avatar")
+
     def perform_create(self, serializer):
         """
         Сохранение пароля и активация учетной записи при создании
@@ -56,11 +79,24 @@ class UserRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
     queryset = User.objects.all()
     serializer_class = UserDetailSerializer
 
+    def get_queryset(self):
+        """
+        Загрузка последних платежей пользователя одним запросом для детальной информации
+        и ширин уменьшенных копий аватара для просмотра
+        """
+        queryset = super().get_queryset()
+        if self.request.method == "GET" and self.get_serializer_class() is UserDetailSerializer:
+            payments = Payment.objects.order_by("-id")[:settings.USER_PAYMENTS_LIMIT]
+            queryset = queryset.prefetch_related(Prefetch("payments", queryset=payments, to_attr="recent_payments"))
+        if self.request.method == "GET":
+            queryset = annotate_derivative_widths(queryset, "avatar")
+        return queryset
+
     def get_serializer_class(self):
         """
         Подбор сериализатора в зависимости от статуса пользователя
         """
-        if self.request.user.is_superuser or self.request.user == self.get_object():
+        if self.request.user.is_superuser or self.request.user.pk == self.kwargs.get("pk"):
             return UserDetailSerializer
         return UserSerializer
 
@@ -75,15 +111,32 @@ class UserRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
         return super().get_permissions()
 
 
-class PaymentListCreateAPIView(generics.ListCreateAPIView):
+class UserPaymentListAPIView(generics.ListAPIView):
     """
-    Дженерик для отображения списка и создания нового объекта Payment:
+    Дженерик для постраничного отображения истории платежей пользователя по курсору:
+    """
+    serializer_class = PaymentSerializer
+    pagination_class = PaymentHistoryPaginator
+    permission_classes = [IsAccountOwner | IsModerator | IsAdminUser]
+
+    def get_queryset(self):
+        """
+        Платежи пользователя из адреса запроса
+        """
+        return Payment.objects.filter(owner=self.kwargs["pk"])
+
+
+class PaymentListCreateAPIView(IdempotentCreateMixin, generics.ListCreateAPIView):
+    """
+    Дженерик для отображения списка и создания нового объекта Payment,
+    повторный запрос с тем же заголовком Idempotency-Key получает первый ответ:
     """
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
+    pagination_class = CursorPaginator
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     ordering_fields = ["payment_date"]
-    filterset_fields = ["course", "lesson", "payment_method"]
+    filterset_class = PaymentFilter
 
     def get_queryset(self):
         """
@@ -93,16 +146,36 @@ class PaymentListCreateAPIView(generics.ListCreateAPIView):
 
     def perform_create(self, serializer):
         """
-        Сохранение владельца при создании объекта
+        Сохранение владельца при создании объекта и запуск создания сессии на оплату в stripe в фоне
+        """
+        payment = serializer.save(owner=self.request.user, status="pending")
+        transaction.on_commit(lambda: start_payment_checkout(payment.pk))
+
+
+class PaymentExportAPIView(generics.GenericAPIView):
+    """
+    Потоковая выгрузка платежей для администратора в формате CSV или NDJSON (параметр file_format),
+    платежи фильтруются по курсу, уроку, способу оплаты и периоду оплаты (date_from, date_to)
+    """
+    queryset = Payment.objects.all()
+    permission_classes = [IsAdminUser]
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = PaymentFilter
+    pagination_class = None
+
+    def get(self, request, *args, **kwargs):
+        """
+        Выгрузка без загрузки всех платежей в память
         """
-        payment = serializer.save()
-        payment.owner = self.request.user
-        price = create_stripe_price(payment)
+        file_format = request.query_params.get("file_format", "csv")
+        if file_format not in EXPORTERS:
+            raise ValidationError({"file_format": f"Доступные форматы: {', '.join(EXPORTERS)}"})
 
-        session_id, payment_link = create_stripe_session(price)
-        payment.session_id = session_id
-        payment.link = payment_link
-        payment.save()
+        queryset = self.filter_queryset(self.get_queryset())
+        response = StreamingHttpResponse(EXPORTERS[file_format](queryset),
+                                         content_type=EXPORT_CONTENT_TYPES[file_format])
+        response["Content-Disposition"] = f'attachment; filename="payments.{file_format}"'
+        return response
 
 
 class PaymentRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
@@ -122,15 +195,78 @@ class PaymentRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView)
             self.permission_classes = [IsModerator | IsAdminUser]
         return super().get_permissions()
 
-    def get_object(self):
+
+class PaymentStatusAPIView(generics.RetrieveAPIView):
+    """
+    Дженерик для отслеживания статуса оплаты объекта Payment,
+    параметр wait задает время ожидания (в секундах) завершения создания сессии на оплату.
+    Ожидание занимает процесс веб-сервера, поэтому оно ограничено PAYMENT_STATUS_MAX_WAIT:
+    пока платеж в статусе pending, клиенту следует повторять запрос через Retry-After секунд
+    """
+    queryset = Payment.objects.all()
+    serializer_class = PaymentStatusSerializer
+    permission_classes = [IsOwner | IsModerator | IsAdminUser]
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Ожидание выхода платежа из статуса pending, но не дольше указанного времени
+        """
+        try:
+            wait = min(float(request.query_params.get("wait", 0)), settings.PAYMENT_STATUS_MAX_WAIT)
+        except ValueError:
+            raise ValidationError({"wait": "Время ожидания должно быть числом секунд"})
+
+        payment = self.get_object()
+        deadline = time.monotonic() + wait
+        while payment.status == "pending" and time.monotonic() < deadline:
+            time.sleep(settings.PAYMENT_STATUS_POLL_INTERVAL)
+            payment.refresh_from_db(fields=["status", "link", "session_id"])
+
+        response = Response(self.get_serializer(payment).data)
+        if payment.status == "pending":
+            response["Retry-After"] = str(settings.PAYMENT_STATUS_POLL_INTERVAL)
+        return response
+
+
+class StripeWebhookAPIView(APIView):
+    """
+    Прием событий stripe: проверка подписи и сохранение события для фоновой обработки
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request, *args, **kwargs):
         """
-        Уточнение статуса для неоплаченного платежа при обращении к объекту
+        Сохранение события без повторов по ID события
         """
-        payment = super().get_object()
-        if payment.session_id and payment.status == "unpaid":
-            payment.status = check_session_status(payment.session_id)
-            payment.save()
-        return payment
+        if not settings.STRIPE_WEBHOOK_SECRET:
+            return Response({"detail": "Прием событий stripe не настроен"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        try:
+            event = stripe.Webhook.construct_event(request.body,
+                                                   request.headers.get("Stripe-Signature", ""),
+                                                   settings.STRIPE_WEBHOOK_SECRET)
+        except (ValueError, stripe.SignatureVerificationError):
+            return Response({"detail": "Некорректная подпись события"}, status=status.HTTP_400_BAD_REQUEST)
+
+        StripeEvent.objects.bulk_create([StripeEvent(event_id=event.id, type=event.type, payload=event.to_dict())],
+                                        ignore_conflicts=True)
+        schedule_stripe_events_processing()
+        return Response(status=status.HTTP_200_OK)
+
+
+class StripeMetricsAPIView(APIView):
+    """
+    Метрики вызовов API stripe и состояние размыкателя цепи для администраторов:
+    значения накапливаются в памяти процесса, который обрабатывает запрос
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        """
+        Текущие значения метрик по операциям
+        """
+        return Response({"breaker": gateway.breaker.state, "operations": gateway.metrics.snapshot()})
 
 
 class MyToken(TokenObtainPairView):
@@ -141,10 +277,13 @@ class MyToken(TokenObtainPairView):
 
     def post(self, request: Request, *args, **kwargs) -> Response:
         """
-        Заполнение поля last_login при получении токенов авторизации
+        Запись времени входа в буфер last_login при получении токенов авторизации
         """
-        result = super().post(request, *args, **kwargs)
-        user = User.objects.get(email=request.data["email"])
-        user.last_login = timezone.now()
-        user.save()
-        return result
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+
+        last_login_buffer.push(serializer.user.pk, time.time())
+        return Response(serializer.validated_data, status=status.HTTP_200_OK)